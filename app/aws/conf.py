@@ -1,5 +1,7 @@
 import datetime
 
+from boto3.s3.transfer import TransferConfig
+
 AWS_FILE_EXPIRE = 200
 AWS_PRELOAD_METADATA = True
 AWS_QUERYSTRING_AUTH = True
@@ -17,6 +19,13 @@ ADMIN_MEDIA_PREFIX = STATIC_URL + "admin/"
 AWS_S3_SIGNATURE_VERSION = "s3v4"
 AWS_S3_REGION_NAME = "ap-south-1"
 
+# uploads above the threshold go up as multipart, read from the file in
+# chunks, so annotated outputs are streamed rather than buffered
+AWS_S3_TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=8 * 1024 * 1024,
+    multipart_chunksize=8 * 1024 * 1024,
+)
+
 two_months = datetime.timedelta(days=61)
 date_two_months_later = datetime.date.today() + two_months
 expires = date_two_months_later.strftime("%A, %d %B %Y 20:00:00 GMT")
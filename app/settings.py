@@ -111,10 +111,16 @@ if env("DB_ENGINE") == "PG":
         }
     }
 else:
+    # analysis workers write from several threads: a write waits up to
+    # "timeout" seconds for another connection to finish, and the job queue
+    # retries the ones SQLite refuses at once (see core.db). The test
+    # database is a file too, since the in-memory one locks whole tables.
     DATABASES = {
         "default": {
             "ENGINE": "django.db.backends.sqlite3",
             "NAME": BASE_DIR / "db.sqlite3",
+            "OPTIONS": {"timeout": 20},
+            "TEST": {"NAME": BASE_DIR / "test_db.sqlite3"},
         }
     }
 
@@ -174,6 +180,103 @@ else:
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
+# Analysis
+# Named margin profiles in inches. A review request picks one with
+# `margin_profile` (DEFAULT_MARGIN_PROFILE when blank) and can override
+# single sides with its own margin fields.
+
+MARGIN_PROFILES = {
+    "default": {"left": 1.5, "top": 1, "right": 1, "bottom": 1},
+}
+DEFAULT_MARGIN_PROFILE = env("DEFAULT_MARGIN_PROFILE", default="default")
+
+# engine pages are checked with, see services.engines: "plumber" (pdfminer
+# layout analysis) or "fitz" (PyMuPDF). A review request's `engine` field
+# overrides it.
+ANALYSIS_ENGINE = env("ANALYSIS_ENGINE", default="plumber")
+
+# PlumberAnalyzer checks pages in worker processes when ANALYSIS_WORKERS > 1,
+# ANALYSIS_CHUNK_SIZE pages per task.
+
+ANALYSIS_WORKERS = env.int("ANALYSIS_WORKERS", default=1)
+ANALYSIS_CHUNK_SIZE = env.int("ANALYSIS_CHUNK_SIZE", default=25)
+
+# side, in points, of the occupancy grid cells text coverage is measured on;
+# box edges are measured exactly whatever the size, smaller cells only
+# separate boxes overlapping within a cell better, and are slower (see
+# services.coverage)
+ANALYSIS_COVERAGE_CELL = env.float("ANALYSIS_COVERAGE_CELL", default=2.0)
+
+# With ANALYSIS_MEASURE_BASELINE every job also times the per-page pdfplumber
+# calls the analyzer made before page features were extracted once, and
+# reports them with the speedup in the job stats. Each checked page is parsed
+# a second time, so leave it off outside of measurements.
+ANALYSIS_MEASURE_BASELINE = env.bool("ANALYSIS_MEASURE_BASELINE", default=False)
+
+# With ANALYSIS_RASTER_VERIFY every checked page is also rendered at
+# ANALYSIS_RASTER_DPI by up to ANALYSIS_RASTER_WORKERS processes and its ink
+# checked, catching vector drawings and scanned pages the text checks can't
+# see into (see services.raster)
+ANALYSIS_RASTER_VERIFY = env.bool("ANALYSIS_RASTER_VERIFY", default=False)
+ANALYSIS_RASTER_DPI = env.int("ANALYSIS_RASTER_DPI", default=36)
+ANALYSIS_RASTER_WORKERS = env.int("ANALYSIS_RASTER_WORKERS", default=2)
+
+# S3 documents are streamed into a spool file in ANALYSIS_SPOOL_DIR (system
+# temp dir when unset) in S3_DOWNLOAD_CHUNK_SIZE byte chunks
+ANALYSIS_SPOOL_DIR = env("ANALYSIS_SPOOL_DIR", default=None)
+S3_DOWNLOAD_CHUNK_SIZE = env.int("S3_DOWNLOAD_CHUNK_SIZE", default=8 * 1024 * 1024)
+
+# annotated outputs are spooled in memory up to this size, then on disk
+OUTPUT_SPOOL_MAX_SIZE = env.int("OUTPUT_SPOOL_MAX_SIZE", default=4 * 1024 * 1024)
+
+# rows per INSERT when storing PageResult rows
+PAGE_RESULT_BATCH_SIZE = env.int("PAGE_RESULT_BATCH_SIZE", default=500)
+
+# Results of documents already analysed with the same margins are reused.
+# Entries unused for ANALYSIS_CACHE_MAX_AGE days, and the least recently
+# used ones beyond ANALYSIS_CACHE_MAX_ENTRIES, are evicted. Each worker
+# evicts at most once per ANALYSIS_CACHE_EVICT_INTERVAL seconds after storing
+# an entry; with 0 eviction is left to `manage.py analysis_cache --evict`.
+ANALYSIS_CACHE_ENABLED = env.bool("ANALYSIS_CACHE_ENABLED", default=True)
+ANALYSIS_CACHE_MAX_ENTRIES = env.int("ANALYSIS_CACHE_MAX_ENTRIES", default=5000)
+ANALYSIS_CACHE_MAX_AGE = env.int("ANALYSIS_CACHE_MAX_AGE", default=30)
+ANALYSIS_CACHE_EVICT_INTERVAL = env.int("ANALYSIS_CACHE_EVICT_INTERVAL", default=3600)
+
+# Review requests are analysed by `manage.py analysis_worker`. A running job
+# renews its lease every ANALYSIS_JOB_LEASE / 3 seconds; a job still marked
+# processing after its lease has run out is assumed to belong to a crashed
+# worker and is picked up again.
+ANALYSIS_JOB_MAX_ATTEMPTS = env.int("ANALYSIS_JOB_MAX_ATTEMPTS", default=3)
+ANALYSIS_JOB_LEASE = env.int("ANALYSIS_JOB_LEASE", default=30 * 60)
+ANALYSIS_JOB_RETRY_DELAY = env.int("ANALYSIS_JOB_RETRY_DELAY", default=60)
+ANALYSIS_WORKER_CONCURRENCY = env.int("ANALYSIS_WORKER_CONCURRENCY", default=1)
+ANALYSIS_WORKER_POLL_INTERVAL = env.float("ANALYSIS_WORKER_POLL_INTERVAL", default=2.0)
+
+# Each job stores its stage timings and page/byte counters on the
+# AnalysisJob and logs them. Jobs slower than ANALYSIS_SLOW_JOB_SECONDS are
+# logged as warnings. The profiling switches run every job under cProfile
+# and/or tracemalloc and store the top ANALYSIS_PROFILE_LIMIT entries on the
+# job; both slow analysis down noticeably.
+ANALYSIS_SLOW_JOB_SECONDS = env.float("ANALYSIS_SLOW_JOB_SECONDS", default=120.0)
+ANALYSIS_PROFILE_CPU = env.bool("ANALYSIS_PROFILE_CPU", default=False)
+ANALYSIS_PROFILE_MEMORY = env.bool("ANALYSIS_PROFILE_MEMORY", default=False)
+ANALYSIS_PROFILE_LIMIT = env.int("ANALYSIS_PROFILE_LIMIT", default=30)
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "formatters": {
+        "analysis": {"format": "%(asctime)s %(levelname)s %(name)s: %(message)s"},
+    },
+    "handlers": {
+        "console": {"class": "logging.StreamHandler", "formatter": "analysis"},
+    },
+    "loggers": {
+        "core": {"handlers": ["console"], "level": env("ANALYSIS_LOG_LEVEL", default="INFO")},
+        "services": {"handlers": ["console"], "level": env("ANALYSIS_LOG_LEVEL", default="INFO")},
+    },
+}
+
 EMAIL_BACKEND = "django.core.mail.backends.smtp.EmailBackend"
 EMAIL_HOST = "smtp.gmail.com"
 EMAIL_HOST_USER = ""
@@ -1,105 +1,34 @@
 import pdfplumber
-import re
 
-def is_likely_page_number(number, text_obj, page_num, total_pages):
-    """
-    Helper function to determine if a number is likely to be a page number
-    """
-    # Check if number is within reasonable range
-    if not (0 <= number <= total_pages + 10):
-        return False
-    
-    # Check if the text is standalone
-    cleaned_text = text_obj['text'].strip('.- ')
-    if not cleaned_text.isdigit():
-        return False
-    
-    # Width check
-    if text_obj['width'] > 100:
-        return False
-    
-    # Page number proximity check
-    if abs(number - (page_num + 1)) > 10:
-        return False
-        
-    return True
+from services.page_features import PageFeatures
+from services.page_numbers import PAGE_COUNT_SLACK, PageNumberFinder
+
 
 def check_page_numbers(pdf_path):
     """
     Check each page of the PDF for page numbers using prioritized margin checking
     Returns a list of dictionaries containing information about page numbers
+
+    The detection itself is services.page_numbers, the stage the analyzers
+    run for every review request.
     """
     results = []
-    INCH_IN_POINTS = 72
-    
-    # Define margin checks in priority order: (margin_size, position)
-    MARGIN_CHECKS = [
-        (0.6, "bottom", "strict"),    # First check bottom 0.6 inch
-        (0.6, "top", "strict"),       # Then top 0.6 inch
-        (1.1, "bottom", "normal"),    # Then bottom 1.1 inch
-        (1.1, "top", "normal"),       # Then top 1.1 inch
-        (1.3, "bottom", "relaxed"),   # Then bottom 1.3 inch
-        (1.3, "top", "relaxed")       # Finally top 1.3 inch
-    ]
-    
+
     with pdfplumber.open(pdf_path) as pdf:
         total_pages = len(pdf.pages)
-        
-        for page_num in range(total_pages):
-            page = pdf.pages[page_num]
-            page_height = page.height
-            
-            # Extract text with position information
-            text_with_coords = page.extract_words(
-                keep_blank_chars=True,
-                x_tolerance=4,
-                y_tolerance=4
-            )
-            
-            # Initialize variables
-            page_number_found = False
-            position = None
-            actual_number = None
-            margin_used = None
-            
-            # Check each margin position in priority order
-            for margin_size, check_position, strictness in MARGIN_CHECKS:
-                if page_number_found:
-                    break
-                    
-                margin_in_points = INCH_IN_POINTS * margin_size
-                
-                for text_obj in text_with_coords:
-                    text = text_obj['text'].strip()
-                    if re.match(r'^[-. ]*\d+[-. ]*$', text):
-                        number = int(''.join(filter(str.isdigit, text)))
-                        y_position = text_obj['top']
-                        
-                        if not is_likely_page_number(number, text_obj, page_num, total_pages):
-                            continue
-                        
-                        # Check position based on priority
-                        if check_position == "bottom" and y_position >= (page_height - margin_in_points):
-                            page_number_found = True
-                            actual_number = number
-                            position = "bottom"
-                            margin_used = margin_size
-                            break
-                        elif check_position == "top" and y_position <= margin_in_points:
-                            page_number_found = True
-                            actual_number = number
-                            position = "top"
-                            margin_used = margin_size
-                            break
-            
+        finder = PageNumberFinder(max_number=total_pages + PAGE_COUNT_SLACK)
+
+        for page in pdf.pages:
+            label = finder.find(PageFeatures(page))["label"]
             results.append({
-                'page': page_num + 1,
-                'has_page_number': page_number_found,
-                'position': position,
-                'found_number': actual_number,
-                'margin_size': margin_used
+                'page': page.page_number,
+                'has_page_number': label is not None,
+                'position': label["position"] if label else None,
+                'found_number': label["value"] if label else None,
+                'margin_size': label["margin"] if label else None
             })
-    
+            page.close()
+
     return results
 
 def print_results(results):
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import ReviewRequest, PageResult
+from .models import ReviewRequest, PageResult, AnalysisJob, AnalysisCache
 
 
 class ReviewRequestAdmin(admin.ModelAdmin):
@@ -20,3 +20,22 @@ class PageResultAdmin(admin.ModelAdmin):
 
 
 admin.site.register(PageResult, PageResultAdmin)
+
+
+class AnalysisJobAdmin(admin.ModelAdmin):
+    list_display = ('review_request', 'status', 'attempts', 'locked_by', 'started_at', 'finished_at', 'duration', 'peak_rss', 'cache_hit')
+    list_filter = ('status', 'cache_hit', 'created_at', 'finished_at')
+    search_fields = ('review_request__id', 'locked_by', 'error')
+    readonly_fields = ('created_at', 'updated_at', 'started_at', 'finished_at', 'duration', 'peak_rss', 'timings', 'stats', 'profile')
+
+
+admin.site.register(AnalysisJob, AnalysisJobAdmin)
+
+
+class AnalysisCacheAdmin(admin.ModelAdmin):
+    list_display = ('fingerprint', 'hits', 'last_used_at', 'created_at')
+    search_fields = ('fingerprint',)
+    readonly_fields = ('created_at', 'updated_at', 'last_used_at')
+
+
+admin.site.register(AnalysisCache, AnalysisCacheAdmin)
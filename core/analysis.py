@@ -0,0 +1,221 @@
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+
+import boto3
+import fitz
+import os
+import tempfile
+import time
+from boto3.s3.transfer import TransferConfig
+from contextlib import contextmanager
+
+from services.page_fingerprint import page_fingerprints
+from services.page_sequence import fit_page_numbers
+
+from core.cache import (
+    analysis_config,
+    config_salt,
+    document_fingerprint,
+    get_cached_analysis,
+    raster_dpi,
+    store_analysis,
+)
+from core.models import PageResult
+
+USE_S3 = settings.USE_S3
+
+
+@contextmanager
+def local_document(instance):
+    """
+    Yield a local filesystem path for the review request's document.
+
+    With S3 the object is streamed in chunks into a spool file that is
+    removed when the block exits, so the document is never held in memory
+    and no temp file outlives the job.
+    """
+    if not USE_S3:
+        yield instance.document.path
+        return
+
+    s3 = boto3.client("s3")
+    path = f"media/{instance.document.name}"
+    config = TransferConfig(
+        multipart_chunksize=settings.S3_DOWNLOAD_CHUNK_SIZE,
+        io_chunksize=settings.S3_DOWNLOAD_CHUNK_SIZE,
+    )
+    with tempfile.NamedTemporaryFile(
+        suffix=".pdf", dir=settings.ANALYSIS_SPOOL_DIR
+    ) as tmp_file:
+        s3.download_fileobj(
+            settings.AWS_STORAGE_BUCKET_NAME, path, tmp_file, Config=config
+        )
+        tmp_file.flush()
+        yield tmp_file.name
+
+
+def analyse_review_request(instance):
+    """
+    Run the analysis for a review request with its engine, save the
+    annotated output and the per-page results. Documents already analysed
+    with the same configuration are served from the analysis cache, and for
+    a revision only the pages that changed since the parent are checked
+    again.
+
+    Returns {"timings": ..., "stats": ..., "cache_hit": ...}: seconds per
+    stage, and the page and byte counters of the run.
+    """
+    profile = instance.get_margin_profile()
+    engine = instance.get_engine()
+    config = analysis_config(profile, engine)
+    started = time.perf_counter()
+    with local_document(instance) as document_path:
+        download_time = time.perf_counter() - started
+        bytes_read = os.path.getsize(document_path)
+
+        started = time.perf_counter()
+        fingerprint = document_fingerprint(document_path, config)
+        fingerprint_time = time.perf_counter() - started
+
+        entry = get_cached_analysis(fingerprint)
+        if entry is not None:
+            started = time.perf_counter()
+            instance.output.name = entry.output.name
+            instance.page_numbering = fit_page_numbers(entry.results)
+            instance.save()
+            save_page_results(
+                instance,
+                entry.results,
+                service=engine.name,
+                fingerprints=entry.page_fingerprints,
+            )
+            timings = {
+                "download": download_time,
+                "fingerprint": fingerprint_time,
+                "persist": time.perf_counter() - started,
+            }
+            stats = {
+                "pages": len(entry.results),
+                "pages_checked": 0,
+                "pages_reused": len(entry.results),
+                "pages_flagged": sum(1 for result in entry.results if result["violations"]),
+                "bytes_read": bytes_read,
+                "bytes_written": 0,
+            }
+            return {"timings": timings, "stats": stats, "cache_hit": True}
+
+        started = time.perf_counter()
+        # read through MuPDF, so documents without flagged pages are never
+        # parsed by PyPDF2; the fitz engine checks the same open document
+        with fitz.open(document_path) as document:
+            fingerprints = page_fingerprints(document, salt=config_salt(config))
+            known_results = parent_results(instance, fingerprints, service=engine.name)
+            fingerprint_time += time.perf_counter() - started
+
+            service = engine(
+                document_path,
+                workers=settings.ANALYSIS_WORKERS,
+                chunk_size=settings.ANALYSIS_CHUNK_SIZE,
+                known_results=known_results,
+                profile=profile,
+                document=document,
+                coverage_cell=settings.ANALYSIS_COVERAGE_CELL,
+                raster_dpi=raster_dpi(),
+                raster_workers=settings.ANALYSIS_RASTER_WORKERS,
+                measure_baseline=settings.ANALYSIS_MEASURE_BASELINE,
+            )
+
+        started = time.perf_counter()
+        instance.page_numbering = service.page_numbering
+        save_output(instance, service)
+        results_array = service.results
+        save_page_results(
+            instance, results_array, service=engine.name, fingerprints=fingerprints
+        )
+        store_analysis(fingerprint, instance, results_array, fingerprints)
+        # writing the PDF is timed on its own by the analyzer
+        persist_time = time.perf_counter() - started - service.timings["write"]
+
+    timings = dict(
+        service.timings,
+        download=download_time,
+        fingerprint=fingerprint_time,
+        persist=persist_time,
+    )
+    return {"timings": timings, "stats": service.stats(), "cache_hit": False}
+
+
+def save_output(instance, service):
+    """
+    Write the annotated PDF to a spooled temp file, which rolls over to disk
+    past OUTPUT_SPOOL_MAX_SIZE, and hand the file to the storage backend.
+    S3 storage uploads it with upload_fileobj, in multipart chunks for large
+    outputs, so the PDF is never held in memory as one bytes object.
+    """
+    with tempfile.SpooledTemporaryFile(
+        max_size=settings.OUTPUT_SPOOL_MAX_SIZE, dir=settings.ANALYSIS_SPOOL_DIR
+    ) as spool:
+        service.write_output(spool)
+        spool.seek(0)
+        instance.output.save(f"{instance.id}_output.pdf", File(spool), save=False)
+    instance.save()
+
+
+def parent_results(instance, fingerprints, service="plumber"):
+    """
+    Map the page numbers of a revision to the parent's results for every
+    page whose fingerprint also appears in the parent, wherever it moved.
+    """
+    if instance.parent_id is None:
+        return {}
+
+    parent_details = dict(
+        PageResult.objects.filter(review_request_id=instance.parent_id, service=service)
+        .exclude(fingerprint="")
+        .values_list("fingerprint", "details")
+    )
+    return {
+        page_number: parent_details[fingerprint]
+        for page_number, fingerprint in enumerate(fingerprints, start=1)
+        # results stored before violations were recorded cannot be redrawn
+        if fingerprint in parent_details and "violations" in parent_details[fingerprint]
+    }
+
+
+def save_page_results(
+    instance, results_array, service="plumber", batch_size=None, fingerprints=None
+):
+    """
+    Persist the per-page results in one transaction with batched INSERTs.
+
+    Rows already stored for the same page (a re-analysis or a retried job)
+    are updated in place through ON CONFLICT on the
+    (review_request, page_number, service) unique constraint, and rows for
+    pages that no longer exist are removed.
+    """
+    batch_size = batch_size or settings.PAGE_RESULT_BATCH_SIZE
+    page_results = [
+        PageResult(
+            review_request=instance,
+            page_number=details["page_number"],
+            service=service,
+            details=details,
+            flaged=((not details["inside_borders"]) or details["is_blank"]),
+            fingerprint=fingerprints[index] if fingerprints else "",
+        )
+        for index, details in enumerate(results_array)
+    ]
+    with transaction.atomic():
+        PageResult.objects.bulk_create(
+            page_results,
+            batch_size=batch_size,
+            update_conflicts=True,
+            unique_fields=["review_request", "page_number", "service"],
+            update_fields=["details", "flaged", "fingerprint", "is_active", "updated_at"],
+        )
+        PageResult.objects.filter(
+            review_request=instance,
+            service=service,
+            page_number__gt=len(page_results),
+        ).delete()
@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class ResultsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        from django.conf import settings
+        from services.margin_profile import MarginProfile, register_profile
+
+        for name, margins in settings.MARGIN_PROFILES.items():
+            register_profile(name, MarginProfile.from_inches(**margins))
@@ -0,0 +1,211 @@
+import multiprocessing
+import platform
+import tempfile
+import time
+import timeit
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import fitz
+import pdfplumber
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.db import connections, transaction
+from django.utils import timezone
+
+from core.analysis import save_output, save_page_results
+from core.cache import analysis_config, config_salt, raster_dpi
+from core.jobs import peak_rss
+from core.models import ReviewRequest
+from services.engines import get_engine
+from services.margin_profile import DEFAULT_PROFILE
+from services.margins import check_margins_array, check_margins_loop
+from services.page_features import PageFeatures
+from services.page_fingerprint import page_fingerprints
+from services.synthetic import THESIS_MIX, generate_document
+from users.models import User
+
+BENCHMARK_VERSION = 2
+
+DATA_DIR = Path(settings.BASE_DIR) / "data"
+
+STAGES = ("fingerprint", "open", "extract", "checks", "raster", "sequence", "overlay", "write", "persist")
+
+# runs faster than this are too noisy to call a regression
+MIN_REGRESSION_SECONDS = 0.05
+# calls timed per page and path by margin_check_benchmark, best of 5
+MARGIN_CHECK_CALLS = 200
+
+
+def sample_documents():
+    return sorted(DATA_DIR.glob("*.pdf"))
+
+
+def synthetic_documents(directory, page_counts, seed=0):
+    documents = []
+    for pages in page_counts:
+        path = Path(directory) / f"synthetic-{pages}.pdf"
+        generate_document(path, pages=pages, seed=seed, **THESIS_MIX)
+        documents.append(path)
+    return documents
+
+
+def benchmark_run(document_path, engine_name, workers):
+    """
+    Fingerprint and analyse one document and persist its results the way an
+    analysis job missing the cache does, returning the stage timings.
+
+    The review request and page results are written inside a transaction
+    that is rolled back. The output goes to a temporary directory rather
+    than the configured storage, which with USE_S3 is the production
+    bucket, so a run leaves nothing behind.
+    """
+    engine = get_engine(engine_name)
+    started = time.perf_counter()
+    config = analysis_config(DEFAULT_PROFILE, engine)
+    with fitz.open(document_path) as document:
+        fingerprints = page_fingerprints(document, salt=config_salt(config))
+        fingerprint = time.perf_counter() - started
+        service = engine(
+            str(document_path),
+            workers=workers,
+            document=document,
+            coverage_cell=settings.ANALYSIS_COVERAGE_CELL,
+            raster_dpi=raster_dpi(),
+            raster_workers=settings.ANALYSIS_RASTER_WORKERS,
+        )
+
+    persist_started = time.perf_counter()
+    with tempfile.TemporaryDirectory() as output_directory, transaction.atomic():
+        reviewer = User.objects.create(
+            phone=f"benchmark-{uuid.uuid4()}",
+            email=f"benchmark-{uuid.uuid4()}@example.com",
+            first_name="Benchmark",
+            last_name="Run",
+        )
+        instance = ReviewRequest.objects.create(
+            reviewer=reviewer, document=Path(document_path).name, comments="", engine=engine_name
+        )
+        instance.output.storage = FileSystemStorage(location=output_directory)
+        save_output(instance, service)
+        save_page_results(
+            instance, service.results, service=engine_name, fingerprints=fingerprints
+        )
+        persist = time.perf_counter() - persist_started - service.timings["write"]
+        transaction.set_rollback(True)
+
+    timings = {stage: service.timings.get(stage, 0.0) for stage in STAGES}
+    timings["fingerprint"] = fingerprint
+    timings["persist"] = persist
+    timings["total"] = time.perf_counter() - started
+    pages = len(service.results)
+    return {
+        "document": Path(document_path).name,
+        "engine": engine_name,
+        "pages": pages,
+        "size": Path(document_path).stat().st_size,
+        "timings": {stage: round(value, 4) for stage, value in timings.items()},
+        "pages_per_second": round(pages / timings["total"], 2) if timings["total"] else None,
+        "peak_rss": peak_rss(),
+    }
+
+
+def run_isolated(document_path, engine_name, workers):
+    """
+    Run benchmark_run in a fresh child process, so every run starts with
+    cold caches and its peak RSS is its own rather than the largest so far.
+    """
+    # the child must not share the parent's database connections
+    connections.close_all()
+    context = multiprocessing.get_context("fork")
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+        return executor.submit(benchmark_run, document_path, engine_name, workers).result()
+
+
+def run_benchmark(documents, engine_names, workers=1, repeat=1, progress=None):
+    """
+    Benchmark every document with every engine, keeping the fastest of
+    `repeat` runs. Returns a JSON-ready report.
+    """
+    runs = []
+    for document_path in documents:
+        for engine_name in engine_names:
+            best = None
+            for _ in range(max(1, repeat)):
+                run = run_isolated(document_path, engine_name, workers)
+                if best is None or run["timings"]["total"] < best["timings"]["total"]:
+                    best = run
+            runs.append(best)
+            if progress is not None:
+                progress(best)
+    return {
+        "version": BENCHMARK_VERSION,
+        "created_at": timezone.now().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "workers": workers,
+        "repeat": repeat,
+        "runs": runs,
+    }
+
+
+def compare_reports(baseline, current, threshold):
+    """
+    Match runs by document and engine and return the ones whose total time
+    grew by more than `threshold` (0.2 is 20%) over the baseline.
+    """
+    baseline_runs = {(run["document"], run["engine"]): run for run in baseline["runs"]}
+    regressions = []
+    for run in current["runs"]:
+        previous = baseline_runs.get((run["document"], run["engine"]))
+        if previous is None:
+            continue
+        before = previous["timings"]["total"]
+        after = run["timings"]["total"]
+        if after - before > max(before * threshold, MIN_REGRESSION_SECONDS):
+            regressions.append(
+                {
+                    "document": run["document"],
+                    "engine": run["engine"],
+                    "baseline": before,
+                    "current": after,
+                    "change": round((after - before) / before, 4) if before else None,
+                }
+            )
+    return regressions
+
+
+def margin_check_benchmark(documents, calls=MARGIN_CHECK_CALLS):
+    """
+    Microseconds per page the text margin check takes on the array path and
+    on the loop, per document. Both get the same word boxes array, which
+    the page features build once per page for every check that reads it.
+    """
+    rows = []
+    for document_path in documents:
+        pages = boxes = 0
+        seconds = {"array": 0.0, "loop": 0.0}
+        with pdfplumber.open(document_path) as pdf:
+            for page in pdf.pages:
+                features = PageFeatures(page)
+                limits = DEFAULT_PROFILE.limits(features.width, features.height, tolerance=2)
+                for path, check in (("array", check_margins_array), ("loop", check_margins_loop)):
+                    seconds[path] += min(
+                        timeit.repeat(
+                            lambda: check(features.word_boxes, limits), number=calls, repeat=5
+                        )
+                    ) / calls
+                pages += 1
+                boxes += len(features.word_boxes)
+                page.close()
+        rows.append(
+            {
+                "document": Path(document_path).name,
+                "pages": pages,
+                "boxes_per_page": round(boxes / pages) if pages else 0,
+                "array": round(seconds["array"] / pages * 1e6, 1) if pages else None,
+                "loop": round(seconds["loop"] / pages * 1e6, 1) if pages else None,
+            }
+        )
+    return rows
@@ -0,0 +1,134 @@
+import hashlib
+import json
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError
+from django.db.models import F, Count, Q
+from django.utils import timezone
+
+from core.db import retry_locked
+from core.models import AnalysisCache, AnalysisJob
+
+# bump whenever a change to the analyzers changes their results, so entries
+# computed by older code are never served
+CACHE_VERSION = 14
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# time.monotonic() of this process's last automatic eviction
+_last_eviction = None
+
+
+def analysis_config(profile, engine):
+    return dict(
+        profile.as_dict(),
+        engine=engine.name,
+        coverage_cell=settings.ANALYSIS_COVERAGE_CELL,
+        raster_dpi=raster_dpi(),
+        version=CACHE_VERSION,
+    )
+
+
+def raster_dpi():
+    """The raster verification resolution, None when it is off."""
+    return settings.ANALYSIS_RASTER_DPI if settings.ANALYSIS_RASTER_VERIFY else None
+
+
+def config_salt(config):
+    return json.dumps(config, sort_keys=True).encode()
+
+
+def document_fingerprint(document_path, config):
+    digest = hashlib.sha256(config_salt(config))
+    with open(document_path, "rb") as document:
+        while chunk := document.read(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def get_cached_analysis(fingerprint):
+    """Return the cache entry for the fingerprint, counting the hit, or None."""
+    if not settings.ANALYSIS_CACHE_ENABLED:
+        return None
+
+    entry = AnalysisCache.objects.filter(fingerprint=fingerprint).first()
+    if entry is None:
+        return None
+    if entry.output and not entry.output.storage.exists(entry.output.name):
+        # the shared output file was removed behind our back
+        entry.delete()
+        return None
+
+    AnalysisCache.objects.filter(pk=entry.pk).update(
+        hits=F("hits") + 1, last_used_at=timezone.now()
+    )
+    return entry
+
+
+def store_analysis(fingerprint, instance, results, page_fingerprints):
+    if not settings.ANALYSIS_CACHE_ENABLED:
+        return
+
+    save_cache_entry(fingerprint, instance.output.name, results, page_fingerprints)
+    evict_if_due()
+
+
+@retry_locked
+def save_cache_entry(fingerprint, output_name, results, page_fingerprints):
+    try:
+        AnalysisCache.objects.update_or_create(
+            fingerprint=fingerprint,
+            defaults={
+                "results": results,
+                "page_fingerprints": page_fingerprints,
+                "output": output_name,
+                "last_used_at": timezone.now(),
+            },
+        )
+    except IntegrityError:
+        # another worker stored the same document first
+        pass
+
+
+def evict_if_due():
+    """
+    Run evict_analysis_cache at most once per ANALYSIS_CACHE_EVICT_INTERVAL
+    seconds in this process, never when the interval is 0; returns the
+    number of evicted entries.
+    """
+    global _last_eviction
+    interval = settings.ANALYSIS_CACHE_EVICT_INTERVAL
+    now = time.monotonic()
+    if not interval or (_last_eviction is not None and now - _last_eviction < interval):
+        return 0
+    _last_eviction = now
+    return evict_analysis_cache()
+
+
+def evict_analysis_cache():
+    """
+    Drop entries unused for ANALYSIS_CACHE_MAX_AGE days, then the least
+    recently used ones beyond ANALYSIS_CACHE_MAX_ENTRIES. Output files are
+    left alone since the review requests still reference them.
+    """
+    cutoff = timezone.now() - timedelta(days=settings.ANALYSIS_CACHE_MAX_AGE)
+    evicted, _ = AnalysisCache.objects.filter(last_used_at__lt=cutoff).delete()
+
+    overflow = AnalysisCache.objects.order_by("-last_used_at").values_list(
+        "pk", flat=True
+    )[settings.ANALYSIS_CACHE_MAX_ENTRIES:]
+    overflow = list(overflow)
+    if overflow:
+        evicted += AnalysisCache.objects.filter(pk__in=overflow).delete()[0]
+    return evicted
+
+
+def cache_stats():
+    stats = AnalysisJob.objects.aggregate(
+        hits=Count("pk", filter=Q(cache_hit=True)),
+        misses=Count("pk", filter=Q(cache_hit=False)),
+    )
+    stats.update(AnalysisCache.objects.aggregate(entries=Count("pk")))
+    return stats
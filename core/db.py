@@ -0,0 +1,44 @@
+import functools
+import logging
+import time
+
+from django.db import OperationalError, connection
+
+logger = logging.getLogger(__name__)
+
+# attempts at a write SQLite reports as locked, and the wait before the
+# first retry in seconds, doubled for every one after it
+LOCK_ATTEMPTS = 5
+LOCK_RETRY_DELAY = 0.1
+
+
+def is_lock_error(exc):
+    # "database is locked" between connections, "database table is locked"
+    # between connections sharing a cache
+    return isinstance(exc, OperationalError) and "locked" in str(exc)
+
+
+def retry_locked(func):
+    """
+    Retry a write that SQLite refused because another connection holds the
+    database. Its busy timeout only covers statements that can wait: a
+    transaction that has read and then writes while another connection
+    writes fails at once, as update_or_create does when two workers store
+    at the same time.
+
+    Only retried outside of a transaction, where the failed attempt has
+    been rolled back in full; other databases never raise these errors.
+    """
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        for attempt in range(1, LOCK_ATTEMPTS + 1):
+            try:
+                return func(*args, **kwargs)
+            except OperationalError as exc:
+                if not is_lock_error(exc) or attempt == LOCK_ATTEMPTS or connection.in_atomic_block:
+                    raise
+                logger.debug("%s found the database locked (attempt %s)", func.__name__, attempt)
+                time.sleep(LOCK_RETRY_DELAY * 2 ** (attempt - 1))
+
+    return wrapper
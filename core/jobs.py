@@ -0,0 +1,384 @@
+import logging
+import os
+import resource
+import socket
+import sys
+import threading
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+from django.db.models import F, Q
+from django.utils import timezone
+
+from core.analysis import analyse_review_request
+from core.db import retry_locked
+from core.models import AnalysisJob
+from core.profiling import ProfileCapture
+
+logger = logging.getLogger(__name__)
+
+
+def default_worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+
+# Linux keeps the resident set high-water mark in VmHWM and resets it to the
+# current RSS when "5" is written to clear_refs
+PROC_STATUS = "/proc/self/status"
+PROC_CLEAR_REFS = "/proc/self/clear_refs"
+
+
+def peak_rss():
+    """
+    High-water resident set size of this process, in bytes: since the last
+    reset_peak_rss on Linux, over the process lifetime elsewhere.
+    """
+    try:
+        with open(PROC_STATUS) as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes everywhere else
+    return usage if sys.platform == "darwin" else usage * 1024
+
+
+def reset_peak_rss():
+    """Restart the high-water mark from the current RSS, False if unsupported."""
+    try:
+        with open(PROC_CLEAR_REFS, "w") as clear_refs:
+            clear_refs.write("5")
+    except OSError:
+        return False
+    return True
+
+
+class PeakRSS:
+    """
+    Measure the peak RSS of the worker process while a block runs, as
+    `peak` in bytes.
+
+    The high-water mark is process wide, so it is only reset when no other
+    block is running; with --concurrency > 1 a job overlapping others
+    reports the peak over the whole overlap. Where the mark can't be reset
+    (anything but Linux) `peak` is the process lifetime peak.
+
+    Only the worker process is measured. The page check and raster pools
+    run in processes started by a forkserver, so they are not children of
+    the worker and RUSAGE_CHILDREN never sees them either.
+    """
+
+    _lock = threading.Lock()
+    _running = 0
+
+    def __init__(self):
+        self.peak = None
+
+    def __enter__(self):
+        with PeakRSS._lock:
+            if PeakRSS._running == 0:
+                reset_peak_rss()
+            PeakRSS._running += 1
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.peak = peak_rss()
+        with PeakRSS._lock:
+            PeakRSS._running -= 1
+        return False
+
+
+def runnable_jobs(now):
+    """
+    (pk, status, locked_at) of the oldest runnable jobs. Pending jobs are
+    runnable once their run_after has passed, processing jobs once their
+    lease has expired.
+    """
+    stale = now - timedelta(seconds=settings.ANALYSIS_JOB_LEASE)
+    return (
+        AnalysisJob.objects.filter(
+            Q(status=AnalysisJob.PENDING, run_after__isnull=True)
+            | Q(status=AnalysisJob.PENDING, run_after__lte=now)
+            | Q(status=AnalysisJob.PROCESSING, locked_at__lt=stale)
+        )
+        .order_by("created_at")
+        .values_list("pk", "status", "locked_at")[:10]
+    )
+
+
+@retry_locked
+def claim_job(worker_id, pk, status, locked_at, now):
+    """
+    Take the lease of a job read as runnable with `status` and `locked_at`.
+
+    The claim is a conditional UPDATE on the status/locked_at the job was
+    read with, so when two workers race for the same row only one update
+    matches. This works the same on Postgres and SQLite.
+    """
+    return bool(
+        AnalysisJob.objects.filter(pk=pk, status=status, locked_at=locked_at).update(
+            status=AnalysisJob.PROCESSING,
+            locked_by=worker_id,
+            locked_at=now,
+            run_after=None,
+            attempts=F("attempts") + 1,
+            updated_at=now,
+        )
+    )
+
+
+def claim_next_job(worker_id):
+    """Claim the oldest runnable job, or return None when there is none."""
+    now = timezone.now()
+    for pk, status, locked_at in runnable_jobs(now):
+        if claim_job(worker_id, pk, status, locked_at, now):
+            return AnalysisJob.objects.select_related("review_request").get(pk=pk)
+    return None
+
+
+@retry_locked
+def renew_lease(job):
+    """
+    Move the lease of a job this worker still holds forward to now; False
+    once another worker has claimed it.
+    """
+    now = timezone.now()
+    return bool(
+        AnalysisJob.objects.filter(
+            pk=job.pk, status=AnalysisJob.PROCESSING, locked_by=job.locked_by
+        ).update(locked_at=now)
+    )
+
+
+class LeaseHeartbeat:
+    """
+    Renew a job's lease from a background thread every `interval` seconds
+    (a third of ANALYSIS_JOB_LEASE by default) while the block runs, so a
+    job slower than the lease is not claimed again by another worker.
+    """
+
+    def __init__(self, job, interval=None):
+        self.job = job
+        self.interval = interval or settings.ANALYSIS_JOB_LEASE / 3
+        self.lost = False
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self._thread = threading.Thread(
+            target=self.beat, name=f"analysis-lease-{self.job.pk}", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self._stop.set()
+        self._thread.join()
+        return False
+
+    def beat(self):
+        try:
+            while not self._stop.wait(self.interval):
+                if not renew_lease(self.job):
+                    self.lost = True
+                    logger.warning(
+                        "%s lost the lease of analysis job %s", self.job.locked_by, self.job.id
+                    )
+                    return
+        finally:
+            connection.close()
+
+
+def run_job(job):
+    review_request = job.review_request
+
+    if job.attempts > job.max_attempts:
+        # claimed back from a worker that died during the last attempt
+        job.error = job.error or "Worker stopped during the final attempt."
+        finish_job(job, AnalysisJob.FAILED)
+        return job
+
+    job.started_at = timezone.now()
+    job.save(update_fields=["started_at", "updated_at"])
+    review_request.status = AnalysisJob.PROCESSING
+    review_request.save(update_fields=["status", "updated_at"])
+
+    capture = ProfileCapture(
+        cpu=settings.ANALYSIS_PROFILE_CPU,
+        memory=settings.ANALYSIS_PROFILE_MEMORY,
+        limit=settings.ANALYSIS_PROFILE_LIMIT,
+    )
+    rss = PeakRSS()
+    started = time.perf_counter()
+    try:
+        with LeaseHeartbeat(job), rss, capture:
+            report = analyse_review_request(review_request)
+    except Exception:
+        job.duration = time.perf_counter() - started
+        job.peak_rss = rss.peak
+        job.error = traceback.format_exc()
+        job.profile = capture.report
+        logger.exception(
+            "Analysis job %s failed (attempt %s/%s)", job.id, job.attempts, job.max_attempts
+        )
+        if job.attempts < job.max_attempts:
+            job.run_after = timezone.now() + timedelta(
+                seconds=settings.ANALYSIS_JOB_RETRY_DELAY * job.attempts
+            )
+            finish_job(job, AnalysisJob.PENDING)
+        else:
+            finish_job(job, AnalysisJob.FAILED)
+        return job
+
+    job.duration = time.perf_counter() - started
+    job.peak_rss = rss.peak
+    job.timings = report["timings"]
+    job.stats = report["stats"]
+    job.cache_hit = report["cache_hit"]
+    job.profile = capture.report
+    job.error = ""
+    if finish_job(job, AnalysisJob.COMPLETED):
+        log_job(job)
+    return job
+
+
+def log_job(job):
+    """
+    One line per finished job with everything needed to spot a slow one;
+    the same values are passed as `extra` for structured log handlers.
+    """
+    slow = job.duration > settings.ANALYSIS_SLOW_JOB_SECONDS
+    stages = " ".join(
+        f"{stage}={seconds:.3f}s" for stage, seconds in job.timings.items()
+    )
+    counters = " ".join(f"{name}={value}" for name, value in job.stats.items())
+    logger.log(
+        logging.WARNING if slow else logging.INFO,
+        "%s analysis job %s for review request %s in %.2fs (cache hit %s, peak RSS %s MiB): %s %s",
+        "Slow" if slow else "Finished",
+        job.id,
+        job.review_request_id,
+        job.duration,
+        job.cache_hit,
+        job.peak_rss // (1024 * 1024),
+        stages,
+        counters,
+        extra={
+            "job_id": str(job.id),
+            "review_request_id": str(job.review_request_id),
+            "duration": job.duration,
+            "cache_hit": job.cache_hit,
+            "peak_rss": job.peak_rss,
+            "timings": job.timings,
+            "stats": job.stats,
+        },
+    )
+
+
+# fields finish_job writes back to the job row
+FINISH_FIELDS = (
+    "status",
+    "attempts",
+    "run_after",
+    "locked_by",
+    "locked_at",
+    "finished_at",
+    "duration",
+    "peak_rss",
+    "cache_hit",
+    "timings",
+    "stats",
+    "profile",
+    "error",
+    "updated_at",
+)
+
+
+def finish_job(job, status):
+    """
+    Record the outcome of the attempt and release the lease. The update is
+    conditional on this worker still holding the lease: when it expired and
+    another worker claimed the job meanwhile, nothing is written and False
+    is returned.
+    """
+    worker_id = job.locked_by
+    job.status = status
+    job.locked_by = ""
+    job.locked_at = None
+    if status != AnalysisJob.PENDING:
+        job.finished_at = timezone.now()
+    job.updated_at = timezone.now()
+    if not release_job(job, worker_id):
+        logger.warning(
+            "Analysis job %s was claimed by another worker, dropping the outcome of %s",
+            job.id,
+            worker_id,
+        )
+        return False
+
+    review_request = job.review_request
+    review_request.status = status
+    review_request.save(update_fields=["status", "updated_at"])
+    return True
+
+
+@retry_locked
+def release_job(job, worker_id):
+    """Write the job's FINISH_FIELDS if `worker_id` still holds its lease."""
+    return bool(
+        AnalysisJob.objects.filter(pk=job.pk, locked_by=worker_id).update(
+            **{field: getattr(job, field) for field in FINISH_FIELDS}
+        )
+    )
+
+
+def work_loop(stop_event, burst=False, poll_interval=2.0, worker_id=None):
+    """
+    Claim and run jobs until stop_event is set. In burst mode the loop also
+    returns as soon as there is nothing left to claim.
+    """
+    worker_id = worker_id or default_worker_id()
+    try:
+        while not stop_event.is_set():
+            close_old_connections()
+            job = claim_next_job(worker_id)
+            if job is None:
+                if burst:
+                    return
+                stop_event.wait(poll_interval)
+                continue
+            logger.info("%s running analysis job %s", worker_id, job.id)
+            run_job(job)
+            logger.info("%s finished analysis job %s: %s", worker_id, job.id, job.status)
+    finally:
+        connection.close()
+
+
+def work(concurrency=1, burst=False, poll_interval=2.0, stop_event=None):
+    """Run `concurrency` work loops in threads and wait for them to return."""
+    stop_event = stop_event or threading.Event()
+    threads = [
+        threading.Thread(
+            target=work_loop,
+            args=(stop_event, burst, poll_interval),
+            name=f"analysis-worker-{i}",
+            daemon=True,
+        )
+        for i in range(concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    try:
+        # join with a timeout so KeyboardInterrupt reaches the main thread
+        while any(thread.is_alive() for thread in threads):
+            for thread in threads:
+                thread.join(0.5)
+    except KeyboardInterrupt:
+        stop_event.set()
+        for thread in threads:
+            thread.join()
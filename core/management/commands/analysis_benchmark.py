@@ -0,0 +1,118 @@
+import json
+import tempfile
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.benchmark import (
+    STAGES,
+    compare_reports,
+    margin_check_benchmark,
+    run_benchmark,
+    sample_documents,
+    synthetic_documents,
+)
+from services.engines import engine_names
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the analysis engines over the sample documents in data/ and "
+        "generated ones, and write per-stage timings to a JSON report."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--engine",
+            action="append",
+            choices=engine_names(),
+            help="Engine to benchmark, can be repeated. Defaults to every engine.",
+        )
+        parser.add_argument(
+            "--synthetic-pages",
+            type=int,
+            nargs="*",
+            default=[100],
+            help="Page counts of the generated documents to add to the samples.",
+        )
+        parser.add_argument(
+            "--no-samples",
+            action="store_true",
+            help="Only benchmark generated documents.",
+        )
+        parser.add_argument("--seed", type=int, default=0, help="Seed for generated documents.")
+        parser.add_argument("--workers", type=int, default=1, help="Worker processes per analysis.")
+        parser.add_argument("--repeat", type=int, default=1, help="Keep the fastest of this many runs.")
+        parser.add_argument(
+            "--output",
+            default="benchmark.json",
+            help="Where to write the JSON report.",
+        )
+        parser.add_argument(
+            "--compare",
+            metavar="BASELINE",
+            help="Earlier report to compare against; exits with an error on regressions.",
+        )
+        parser.add_argument(
+            "--margins",
+            action="store_true",
+            help=(
+                "Only time the text margin check's array path against its loop on every "
+                "page, instead of the engine runs."
+            ),
+        )
+        parser.add_argument(
+            "--threshold",
+            type=float,
+            default=0.2,
+            help="Allowed slowdown over the baseline before a run counts as a regression.",
+        )
+
+    def handle(self, *args, **options):
+        engines = options["engine"] or engine_names()
+        documents = [] if options["no_samples"] else sample_documents()
+
+        with tempfile.TemporaryDirectory() as directory:
+            documents += synthetic_documents(
+                directory, options["synthetic_pages"], seed=options["seed"]
+            )
+            if not documents:
+                raise CommandError("No documents to benchmark")
+            if options["margins"]:
+                for row in margin_check_benchmark(documents):
+                    self.stdout.write(
+                        f"{row['document']}: {row['pages']} pages, {row['boxes_per_page']} "
+                        f"boxes/page, array {row['array']}us/page, loop {row['loop']}us/page"
+                    )
+                return
+            report = run_benchmark(
+                documents,
+                engines,
+                workers=max(1, options["workers"]),
+                repeat=options["repeat"],
+                progress=self.write_run,
+            )
+
+        with open(options["output"], "w") as output:
+            json.dump(report, output, indent=2)
+        self.stdout.write(f"Report written to {options['output']}")
+
+        if options["compare"]:
+            with open(options["compare"]) as baseline_file:
+                baseline = json.load(baseline_file)
+            regressions = compare_reports(baseline, report, options["threshold"])
+            for regression in regressions:
+                self.stdout.write(
+                    f"{regression['document']} [{regression['engine']}]: "
+                    f"{regression['baseline']:.2f}s -> {regression['current']:.2f}s"
+                )
+            if regressions:
+                raise CommandError(f"{len(regressions)} runs regressed past the threshold")
+            self.stdout.write("No regressions")
+
+    def write_run(self, run):
+        stages = " ".join(f"{stage} {run['timings'][stage]:.3f}" for stage in STAGES)
+        self.stdout.write(
+            f"{run['document']} [{run['engine']}] {run['pages']} pages "
+            f"{run['timings']['total']:.2f}s ({run['pages_per_second']} pages/s, "
+            f"peak RSS {run['peak_rss'] // (1024 * 1024)} MiB): {stages}"
+        )
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from core.cache import cache_stats, evict_analysis_cache
+from core.models import AnalysisCache
+
+
+class Command(BaseCommand):
+    help = "Show analysis cache hit/miss counters and evict stale entries."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--evict",
+            action="store_true",
+            help="Apply the age and size eviction policy now.",
+        )
+        parser.add_argument(
+            "--clear",
+            action="store_true",
+            help="Remove every cache entry.",
+        )
+
+    def handle(self, *args, **options):
+        if options["clear"]:
+            deleted, _ = AnalysisCache.objects.all().delete()
+            self.stdout.write(f"Removed {deleted} cache entries")
+        elif options["evict"]:
+            self.stdout.write(f"Evicted {evict_analysis_cache()} cache entries")
+
+        stats = cache_stats()
+        lookups = stats["hits"] + stats["misses"]
+        hit_rate = stats["hits"] / lookups * 100 if lookups else 0
+        self.stdout.write(f"Entries: {stats['entries']}")
+        self.stdout.write(f"Hits: {stats['hits']}")
+        self.stdout.write(f"Misses: {stats['misses']}")
+        self.stdout.write(f"Hit rate: {hit_rate:.1f}%")
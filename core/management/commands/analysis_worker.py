@@ -0,0 +1,37 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.jobs import work
+
+
+class Command(BaseCommand):
+    help = "Run queued review request analysis jobs."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=settings.ANALYSIS_WORKER_CONCURRENCY,
+            help="Number of jobs to run at the same time.",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=settings.ANALYSIS_WORKER_POLL_INTERVAL,
+            help="Seconds to wait before polling again when the queue is empty.",
+        )
+        parser.add_argument(
+            "--burst",
+            action="store_true",
+            help="Exit once the queue is empty instead of waiting for new jobs.",
+        )
+
+    def handle(self, *args, **options):
+        concurrency = max(1, options["concurrency"])
+        self.stdout.write(f"Starting analysis worker with concurrency {concurrency}")
+        work(
+            concurrency=concurrency,
+            burst=options["burst"],
+            poll_interval=options["poll_interval"],
+        )
+        self.stdout.write("Analysis worker stopped")
@@ -0,0 +1,81 @@
+import json
+from pathlib import Path
+
+from django.core.files import File
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import ReviewRequest
+from services.synthetic import PAGE_NUMBER_STYLES, THESIS_MIX, generate_document
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate deterministic synthetic documents for load and scaling tests, "
+        "optionally submitting them as review requests."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("directory", help="Directory to write the documents to.")
+        parser.add_argument("--count", type=int, default=1, help="Number of documents.")
+        parser.add_argument("--pages", type=int, default=300, help="Pages per document.")
+        parser.add_argument(
+            "--seed",
+            type=int,
+            default=0,
+            help="Seed of the first document; the others use the following seeds.",
+        )
+        parser.add_argument("--text-density", type=float, default=THESIS_MIX["text_density"])
+        parser.add_argument("--images-per-page", type=float, default=THESIS_MIX["images_per_page"])
+        parser.add_argument("--table-rate", type=float, default=THESIS_MIX["table_rate"])
+        parser.add_argument("--violation-rate", type=float, default=THESIS_MIX["violation_rate"])
+        parser.add_argument("--blank-rate", type=float, default=THESIS_MIX["blank_rate"])
+        parser.add_argument("--landscape-rate", type=float, default=THESIS_MIX["landscape_rate"])
+        parser.add_argument(
+            "--page-numbers",
+            choices=PAGE_NUMBER_STYLES,
+            default=THESIS_MIX["page_numbers"],
+        )
+        parser.add_argument("--front-matter", type=int, default=THESIS_MIX["front_matter"])
+        parser.add_argument(
+            "--submit",
+            metavar="PHONE",
+            help="Create a review request for each document, reviewed by this user.",
+        )
+
+    def handle(self, *args, **options):
+        reviewer = None
+        if options["submit"]:
+            reviewer = User.objects.filter(phone=options["submit"]).first()
+            if reviewer is None:
+                raise CommandError(f"No user with phone {options['submit']}")
+
+        directory = Path(options["directory"])
+        directory.mkdir(parents=True, exist_ok=True)
+        for seed in range(options["seed"], options["seed"] + options["count"]):
+            path = directory / f"synthetic-{options['pages']}-{seed}.pdf"
+            manifest = generate_document(
+                path,
+                pages=options["pages"],
+                seed=seed,
+                text_density=options["text_density"],
+                images_per_page=options["images_per_page"],
+                table_rate=options["table_rate"],
+                violation_rate=options["violation_rate"],
+                blank_rate=options["blank_rate"],
+                landscape_rate=options["landscape_rate"],
+                page_numbers=options["page_numbers"],
+                front_matter=options["front_matter"],
+            )
+            # what each page should be flagged for, to check results against
+            path.with_suffix(".json").write_text(json.dumps(manifest, indent=2))
+            self.stdout.write(f"Wrote {path}")
+
+            if reviewer is not None:
+                with open(path, "rb") as document:
+                    review_request = ReviewRequest.objects.create(
+                        reviewer=reviewer,
+                        document=File(document, name=path.name),
+                        comments="Synthetic load test document",
+                    )
+                self.stdout.write(f"Submitted review request {review_request.id}")
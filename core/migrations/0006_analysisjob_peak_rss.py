@@ -0,0 +1,18 @@
+# Generated by Django 4.2.14 on 2026-10-18 18:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_analysisjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='analysisjob',
+            name='peak_rss',
+            field=models.PositiveBigIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.14 on 2026-10-18 18:58
+
+from django.db import migrations, models
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_analysisjob_peak_rss'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnalysisCache',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('is_active', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('fingerprint', models.CharField(max_length=64, unique=True)),
+                ('results', models.JSONField()),
+                ('output', models.FileField(blank=True, null=True, upload_to='output/')),
+                ('hits', models.PositiveIntegerField(default=0)),
+                ('last_used_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+            options={
+                'verbose_name': 'Analysis Cache',
+                'verbose_name_plural': 'Analysis Cache',
+            },
+        ),
+        migrations.AddField(
+            model_name='analysisjob',
+            name='cache_hit',
+            field=models.BooleanField(blank=True, null=True),
+        ),
+    ]
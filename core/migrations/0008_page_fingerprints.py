@@ -0,0 +1,23 @@
+# Generated by Django 4.2.14 on 2026-10-18 18:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_analysiscache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='analysiscache',
+            name='page_fingerprints',
+            field=models.JSONField(default=list),
+        ),
+        migrations.AddField(
+            model_name='pageresult',
+            name='fingerprint',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+    ]
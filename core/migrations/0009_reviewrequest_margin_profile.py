@@ -0,0 +1,18 @@
+# Generated by Django 4.2.14 on 2026-10-18 19:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_page_fingerprints'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reviewrequest',
+            name='margin_profile',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.14 on 2026-10-18 19:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_reviewrequest_margin_profile'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reviewrequest',
+            name='engine',
+            field=models.CharField(blank=True, max_length=20),
+        ),
+    ]
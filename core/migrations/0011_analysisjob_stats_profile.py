@@ -0,0 +1,23 @@
+# Generated by Django 4.2.14 on 2026-10-18 19:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_reviewrequest_engine'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='analysisjob',
+            name='profile',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='analysisjob',
+            name='stats',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
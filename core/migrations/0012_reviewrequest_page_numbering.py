@@ -0,0 +1,18 @@
+# Generated by Django 4.2.14 on 2026-10-18 19:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_analysisjob_stats_profile'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reviewrequest',
+            name='page_numbering',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.14 on 2026-10-18 20:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_reviewrequest_page_numbering'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='analysisjob',
+            name='peak_rss',
+            field=models.PositiveBigIntegerField(blank=True, help_text='Peak resident set size of the analysis worker process while the job ran, in bytes. Excludes the ANALYSIS_WORKERS page check and raster verification pool processes, which are not children of the worker.', null=True),
+        ),
+    ]
@@ -3,16 +3,11 @@ from app.models import BaseModel
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 from django.conf import settings
-from django.core.files.base import ContentFile
 
-import boto3
-import tempfile
-from io import BytesIO
 # import fitz
 import re
-from services.plumber_analyzer import PlumberAnalyzer
-
-USE_S3 = settings.USE_S3
+from services.engines import get_engine
+from services.margin_profile import INCH_TO_POINTS, get_profile
 
 
 def upload_to(instance, filename):
@@ -31,75 +26,32 @@ class ReviewRequest(BaseModel):
     bottom_margin = models.FloatField(null=True, blank=True)
     left_margin = models.FloatField(null=True, blank=True)
     right_margin = models.FloatField(null=True, blank=True)
+    # named profile from settings.MARGIN_PROFILES, the margin fields above
+    # (in inches) override single sides of it
+    margin_profile = models.CharField(max_length=100, blank=True)
+    # analysis engine from services.engines, settings.ANALYSIS_ENGINE when blank
+    engine = models.CharField(max_length=20, blank=True)
     output = models.FileField(upload_to="output/", null=True, blank=True)
+    # document-level page number report, see services.page_sequence
+    page_numbering = models.JSONField(default=dict, blank=True)
 
     class Meta:
         verbose_name = "Review Request"
         verbose_name_plural = "Review Requests"
 
+    def get_margin_profile(self):
+        profile = get_profile(self.margin_profile or settings.DEFAULT_MARGIN_PROFILE)
+        overrides = {
+            side: getattr(self, f"{side}_margin") * INCH_TO_POINTS
+            for side in ("left", "top", "right", "bottom")
+            if getattr(self, f"{side}_margin") is not None
+        }
+        if not overrides:
+            return profile
+        return profile.replace(**overrides)
 
-@receiver(post_save, sender=ReviewRequest)
-def review_request_post_save(sender, instance, created, **kwargs):
-    if created:
-        if USE_S3:
-            s3 = boto3.client("s3")
-            document = instance.document
-            path = f"media/{document.name}"
-            document_data = s3.get_object(
-                Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=path
-            )
-            document_content = document_data["Body"].read()
-            document_stream = BytesIO(document_content)
-
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp_file:
-                tmp_file.write(document_content)
-                tmp_file_path = tmp_file.name
-
-            try:
-                # fitz_analyzer = FitsAnalyzer(tmp_file_path, instance.id)
-                # document_stream.close()
-                service = PlumberAnalyzer(tmp_file_path)
-                print(service)
-                output_path = service.output
-                results_array = service.results
-                pdf_bytes = service.get_pdf_bytes()
-                pdf_file = ContentFile(pdf_bytes.read(), name=f"{instance.id}_output.pdf")
-                instance.output.save(pdf_file.name, pdf_file)
-                instance.save()
-                for details in results_array:
-                    page_num = details["page_number"]
-                    PageResult.objects.create(
-                        review_request=instance,
-                        page_number=page_num,
-                        service="plumber",
-                        details=details,
-                        flaged=((not details["inside_borders"]) or details["is_blank"]),
-                    )
-            finally:
-                tmp_file.close()
-        else:
-            document_path = instance.document.path
-            # fitz_analyzer = FitsAnalyzer(document_path, instance.id)
-            # instance.document.close()
-            service = PlumberAnalyzer(document_path)
-            print(service)
-            pdf_bytes = service.get_pdf_bytes()
-            pdf_file = ContentFile(pdf_bytes.read(), name=f"{instance.id}_output.pdf")
-            instance.output.save(pdf_file.name, pdf_file)
-            instance.save()
-            results_array = service.results
-            for details in results_array:
-                page_num = details["page_number"]
-                PageResult.objects.create(
-                    review_request=instance,
-                    page_number=page_num,
-                    service="plumber",
-                    details=details,
-                    flaged=((not details["inside_borders"]) or details["is_blank"]),
-                )
-
-        instance.status = "completed"
-        instance.save()
+    def get_engine(self):
+        return get_engine(self.engine or settings.ANALYSIS_ENGINE)
 
 
 class PageResult(BaseModel):
@@ -110,6 +62,8 @@ class PageResult(BaseModel):
     )  # method or service which was used to extract the data
     details = models.JSONField()
     flaged = models.BooleanField(default=False)
+    # hash of the page content, see services.page_fingerprint
+    fingerprint = models.CharField(max_length=64, blank=True)
 
     def __str__(self):
         return f"{str(self.review_request.id)} - {self.page_number}"
@@ -120,6 +74,87 @@ class PageResult(BaseModel):
         verbose_name_plural = "Page Results"
 
 
+class AnalysisJob(BaseModel):
+    PENDING = "pending"
+    PROCESSING = "processing"
+    COMPLETED = "completed"
+    FAILED = "failed"
+    STATUS_CHOICES = (
+        (PENDING, "Pending"),
+        (PROCESSING, "Processing"),
+        (COMPLETED, "Completed"),
+        (FAILED, "Failed"),
+    )
+
+    review_request = models.ForeignKey(
+        ReviewRequest, on_delete=models.CASCADE, related_name="jobs"
+    )
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    run_after = models.DateTimeField(null=True, blank=True)
+    locked_by = models.CharField(max_length=255, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    duration = models.FloatField(null=True, blank=True)  # seconds
+    # bytes, the worker's peak while the job ran, see core.jobs.PeakRSS
+    peak_rss = models.PositiveBigIntegerField(
+        null=True,
+        blank=True,
+        help_text=(
+            "Peak resident set size of the analysis worker process while the job ran, "
+            "in bytes. Excludes the ANALYSIS_WORKERS page check and raster verification "
+            "pool processes, which are not children of the worker."
+        ),
+    )
+    cache_hit = models.BooleanField(null=True, blank=True)
+    timings = models.JSONField(default=dict, blank=True)  # seconds per stage
+    # pages checked/reused/flagged and bytes read/written
+    stats = models.JSONField(default=dict, blank=True)
+    # cProfile/tracemalloc report, see settings.ANALYSIS_PROFILE_CPU
+    profile = models.TextField(blank=True)
+    error = models.TextField(blank=True)
+
+    def __str__(self):
+        return f"{str(self.review_request_id)} - {self.status}"
+
+    class Meta:
+        ordering = ("created_at",)
+        indexes = [models.Index(fields=["status", "run_after"])]
+        verbose_name = "Analysis Job"
+        verbose_name_plural = "Analysis Jobs"
+
+
+class AnalysisCache(BaseModel):
+    # sha256 of the document bytes and the analysis configuration
+    fingerprint = models.CharField(max_length=64, unique=True)
+    results = models.JSONField()
+    page_fingerprints = models.JSONField(default=list)
+    # the output file of the request that produced the entry, shared by
+    # every request served from the cache
+    output = models.FileField(upload_to="output/", null=True, blank=True)
+    hits = models.PositiveIntegerField(default=0)
+    last_used_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return self.fingerprint
+
+    class Meta:
+        verbose_name = "Analysis Cache"
+        verbose_name_plural = "Analysis Cache"
+
+
+@receiver(post_save, sender=ReviewRequest)
+def review_request_post_save(sender, instance, created, **kwargs):
+    # the analysis itself runs in the analysis_worker command, see core.jobs
+    if created:
+        AnalysisJob.objects.create(
+            review_request=instance,
+            max_attempts=settings.ANALYSIS_JOB_MAX_ATTEMPTS,
+        )
+
+
 # class FitsAnalyzer:
 #     def __init__(self, pdf_path, review_request):
 #         self.pdf = fitz.open(pdf_path)
@@ -0,0 +1,79 @@
+import cProfile
+import io
+import pstats
+import threading
+import tracemalloc
+
+
+class ProfileCapture:
+    """
+    Optionally run a block under cProfile and/or tracemalloc and keep a text
+    report of the slowest functions and the biggest allocation sites.
+
+        with ProfileCapture(cpu=True, memory=True) as capture:
+            analyse_review_request(review_request)
+        job.profile = capture.report
+
+    cProfile only sees the thread that entered the block. tracemalloc is
+    process wide: captures running at the same time share one tracing
+    session, started (and its peak reset) by the first to enter and stopped
+    by the last to exit, so with concurrent jobs the numbers include the
+    others. It is left running if something else had already started it.
+    """
+
+    _lock = threading.Lock()
+    # memory captures currently inside their block
+    _tracers = 0
+    # whether the running session was started by a capture
+    _started_tracing = False
+
+    def __init__(self, cpu=False, memory=False, limit=30):
+        self.cpu = cpu
+        self.memory = memory
+        self.limit = limit
+        self.report = ""
+        self._profiler = None
+
+    def __enter__(self):
+        if self.memory:
+            with ProfileCapture._lock:
+                if ProfileCapture._tracers == 0:
+                    if not tracemalloc.is_tracing():
+                        tracemalloc.start()
+                        ProfileCapture._started_tracing = True
+                    tracemalloc.reset_peak()
+                ProfileCapture._tracers += 1
+        if self.cpu:
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        sections = []
+        if self._profiler is not None:
+            self._profiler.disable()
+            output = io.StringIO()
+            stats = pstats.Stats(self._profiler, stream=output)
+            stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(self.limit)
+            sections.append(output.getvalue())
+        if self.memory:
+            # tracing can't stop under us while this capture is counted
+            try:
+                current, peak = tracemalloc.get_traced_memory()
+                top = tracemalloc.take_snapshot().statistics("lineno")[: self.limit]
+            finally:
+                self._release_tracing()
+            sections.append(
+                f"Traced memory: {current / 1024 / 1024:.1f} MiB now, "
+                f"{peak / 1024 / 1024:.1f} MiB peak\n"
+                + "\n".join(str(statistic) for statistic in top)
+            )
+        self.report = "\n\n".join(sections)
+        return False
+
+    def _release_tracing(self):
+        with ProfileCapture._lock:
+            ProfileCapture._tracers -= 1
+            if ProfileCapture._tracers == 0 and ProfileCapture._started_tracing:
+                tracemalloc.stop()
+                ProfileCapture._started_tracing = False
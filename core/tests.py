@@ -1,3 +1,1093 @@
-from django.test import TestCase
+import io
+import json
+import random
+import subprocess
+import sys
+import tempfile
+import tracemalloc
+from datetime import timedelta
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+import fitz
+import numpy as np
+import pdfplumber
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import CommandError, call_command
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from PyPDF2 import PdfReader, PdfWriter
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfgen import canvas
+from PyPDF2.generic import (
+    DecodedStreamObject,
+    DictionaryObject,
+    NameObject,
+    NumberObject,
+    RectangleObject,
+)
+
+from check_page_numbers import check_page_numbers
+from core import cache
+from core.analysis import analyse_review_request, save_output, save_page_results
+from core.benchmark import benchmark_run
+from core.cache import (
+    analysis_config,
+    document_fingerprint,
+    evict_analysis_cache,
+    get_cached_analysis,
+    store_analysis,
+)
+from core.jobs import (
+    PeakRSS,
+    claim_job,
+    claim_next_job,
+    finish_job,
+    renew_lease,
+    reset_peak_rss,
+    run_job,
+    runnable_jobs,
+    work,
+)
+from core.models import AnalysisCache, AnalysisJob, PageResult, ReviewRequest
+from core.profiling import ProfileCapture
+from main import DocumentSession, page_results
+from services.columns import ColumnDetector
+from services.coverage import CoverageGrid
+from services.engines import get_engine
+from services.fitz_analyzer import FitzAnalyzer, FitzPageFeatures, has_table
+from services.geometry import PageGeometry
+from services.margin_profile import DEFAULT_PROFILE, MarginProfile, register_profile
+from services.margins import (
+    VECTORISE_MIN_BOXES,
+    check_margins,
+    check_margins_array,
+    check_margins_loop,
+)
+from services.overlays import OverlayWriter, box_highlights, margin_overlay
+from services.page_features import PageFeatures
+from services.page_numbers import PageNumberFinder, parse_page_number
+from services.page_sequence import fit_page_numbers
+from services.plumber_analyzer import HIGHLIGHT_COLOR, PlumberAnalyzer
+from services.raster import RasterVerifier, verify_document
+from services.synthetic import generate_document, noise_image
+from users.models import User
+
+DATA_DIR = Path(__file__).resolve().parent.parent / "data"
+
+
+def create_review_request(document="documents/test/paper3.pdf", **fields):
+    reviewer = User.objects.first() or User.objects.create_user(
+        "reviewer@example.com", "password", phone="0000000000"
+    )
+    return ReviewRequest.objects.create(
+        reviewer=reviewer, document=document, comments="", **fields
+    )
+
+
+class EngineParityTest(SimpleTestCase):
+    """The fitz engine must reach the same verdicts as the plumber engine."""
+
+    documents = ("paper3.pdf", "landscape2.pdf", "landscap1.pdf")
+
+    def analyse(self, engine, document):
+        with self.assertLogs("services", level="INFO"):
+            return engine(str(DATA_DIR / document))
+
+    def test_same_results(self):
+        with tempfile.TemporaryDirectory() as directory:
+            # reportlab's blank pages still have a content stream
+            blanks = Path(directory) / "blanks.pdf"
+            generate_document(blanks, pages=12, blank_rate=0.5, table_rate=0.3, seed=3)
+            for document in self.documents + (blanks,):
+                self.assert_same_results(document)
+
+    def assert_same_results(self, document):
+        with self.subTest(document=str(document)):
+            plumber = self.analyse(PlumberAnalyzer, document)
+            fitz = self.analyse(FitzAnalyzer, document)
+            self.assertEqual(len(plumber.results), len(fitz.results))
+            self.assertEqual(plumber.annotated_pages, fitz.annotated_pages)
+            for expected, result in zip(plumber.results, fitz.results):
+                for key in (
+                    "page_number",
+                    "geometry",
+                    "inside_borders",
+                    "is_blank",
+                    "blank_tier",
+                    "violations",
+                ):
+                    self.assertEqual(expected[key], result[key], key)
+                self.assertEqual(expected["columns"]["count"], result["columns"]["count"])
+                # MuPDF's word boxes span the font's ascent to descent,
+                # pdfminer's the font size (16.5 against 12 points for
+                # Helvetica), so MuPDF's coverage runs up to ~35% higher;
+                # 0.1% of a page is about one word
+                self.assertAlmostEqual(
+                    expected["text_percentage"],
+                    result["text_percentage"],
+                    delta=max(expected["text_percentage"] * 0.4, 0.1),
+                )
+
+    def test_same_tables(self):
+        # curves (paper2, project_req), page borders and generated ruled tables
+        with tempfile.TemporaryDirectory() as directory:
+            tables = Path(directory) / "tables.pdf"
+            generate_document(tables, pages=6, table_rate=1.0, blank_rate=0.3)
+            for path in (DATA_DIR / "paper2.pdf", DATA_DIR / "project_req.pdf", tables):
+                with fitz.open(path) as document, pdfplumber.open(path) as pdf:
+                    for page, plumber_page in zip(document, pdf.pages):
+                        with self.subTest(document=path.name, page=page.number + 1):
+                            drawings = page.get_cdrawings()
+                            self.assertEqual(
+                                bool(drawings) and has_table(drawings),
+                                bool(plumber_page.find_tables()),
+                            )
+
+
+class BaselineTest(SimpleTestCase):
+    """The speedup over the old per-page calls is reported per document."""
+
+    def test_speedup_reported(self):
+        path = str(DATA_DIR / "paper3.pdf")
+        with self.assertLogs("services", level="INFO"):
+            measured = PlumberAnalyzer(path, measure_baseline=True)
+            plain = PlumberAnalyzer(path)
+        stats = measured.stats()
+        self.assertGreater(stats["baseline_seconds"], 0)
+        self.assertGreater(stats["speedup"], 0)
+        self.assertEqual(measured.timings["baseline"], measured.baseline_time)
+        self.assertNotIn("speedup", plain.stats())
+        self.assertEqual(measured.results, plain.results)
+
+
+class BlankTierTest(SimpleTestCase):
+    """Blank pages are settled by the cheapest check that can tell."""
+
+    tiers = [
+        (True, "page_number"),
+        (False, "text"),
+        (False, "images"),
+        (True, "empty_content"),
+        (True, "no_graphics"),
+        (False, "tables"),
+        (True, "tables"),
+    ]
+
+    def document(self, path):
+        pdf = canvas.Canvas(str(path), pagesize=A4)
+        pdf.drawString(300, 400, "7")
+        pdf.showPage()
+        pdf.drawString(120, 700, "A line of text")
+        pdf.showPage()
+        pdf.drawImage(noise_image(random.Random(0)), 120, 500, width=100, height=100)
+        pdf.showPage()
+        pdf.showPage()
+        pdf.drawString(300, 400, "ab")
+        pdf.showPage()
+        # a ruled three by three table with empty cells, then a lone rule
+        for row in range(4):
+            pdf.line(120, 600 - row * 20, 420, 600 - row * 20)
+        for column in range(4):
+            pdf.line(120 + column * 100, 600, 120 + column * 100, 540)
+        pdf.showPage()
+        pdf.line(120, 600, 420, 600)
+        pdf.showPage()
+        pdf.save()
+
+    def test_tiers(self):
+        find_tables = pdfplumber.page.Page.find_tables
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / "blanks.pdf"
+            self.document(path)
+            for engine in (PlumberAnalyzer, FitzAnalyzer):
+                with self.subTest(engine=engine.name), mock.patch(
+                    "pdfplumber.page.Page.find_tables", autospec=True, side_effect=find_tables
+                ) as found, self.assertLogs("services", level="INFO"):
+                    analyzer = engine(str(path))
+                    self.assertEqual(
+                        [(result["is_blank"], result["blank_tier"]) for result in analyzer.results],
+                        self.tiers,
+                    )
+                    if engine is PlumberAnalyzer:
+                        # only the two ruled pages get as far as table finding
+                        self.assertEqual(found.call_count, 2)
+
+
+class WorkerPoolTest(SimpleTestCase):
+    """Pages checked in worker processes give the serial results, in order."""
+
+    def test_parallel_matches_serial(self):
+        path = str(DATA_DIR / "paper3.pdf")
+        for engine in (PlumberAnalyzer, FitzAnalyzer):
+            with self.subTest(engine=engine.name), self.assertLogs("services", level="INFO"):
+                serial = engine(path, workers=1)
+                parallel = engine(path, workers=2, chunk_size=3)
+                self.assertEqual(parallel.results, serial.results)
+                self.assertEqual(parallel.annotated_pages, serial.annotated_pages)
+
+
+class RasterVerifierTest(SimpleTestCase):
+    """Ink the text layer can't see is still checked against the margins."""
+
+    def document(self, path):
+        # a clean page of text, then a filled square in the left margin
+        pdf = canvas.Canvas(str(path), pagesize=A4)
+        pdf.drawString(DEFAULT_PROFILE.left, A4[1] - DEFAULT_PROFILE.top - 20, "Inside the margins")
+        pdf.showPage()
+        pdf.drawString(DEFAULT_PROFILE.left, A4[1] - DEFAULT_PROFILE.top - 20, "Inside the margins")
+        pdf.rect(20, A4[1] / 2, 40, 40, stroke=0, fill=1)
+        pdf.showPage()
+        pdf.save()
+
+    def test_ink_outside_margins(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / "ink.pdf"
+            self.document(path)
+            with fitz.open(path) as document:
+                clean, inked = (RasterVerifier().verify(page) for page in document)
+            # one page per worker task, so both pages go through the pool
+            with mock.patch("services.raster.CHUNK_SIZE", 1):
+                reports = verify_document(str(path), [1, 2], workers=2)
+            with self.assertLogs("services", level="INFO"):
+                analyzer = PlumberAnalyzer(str(path), raster_dpi=36, raster_workers=1)
+
+        self.assertTrue(clean["margins"]["inside"])
+        self.assertFalse(inked["margins"]["inside"])
+        self.assertLess(inked["box"][0], DEFAULT_PROFILE.left)
+        self.assertEqual(reports, {1: clean, 2: inked})
+        self.assertEqual([result["violations"] for result in analyzer.results], [[], ["ink"]])
+
+
+class PageNumberTest(SimpleTestCase):
+    """Printed page numbers are found in the bands at the page edges."""
+
+    def test_generated_document(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / "numbered.pdf"
+            manifest = generate_document(
+                path, pages=12, seed=1, violation_rate=0, page_numbers="arabic", front_matter=3
+            )
+            results = check_page_numbers(path)
+
+        self.assertEqual(
+            [result["found_number"] for result in results],
+            [parse_page_number(page["label"])[0] for page in manifest],
+        )
+        # printed just above the 1 inch bottom margin, so the top of the
+        # number is past the 1.1 inch band
+        self.assertEqual(
+            {(result["position"], result["margin_size"]) for result in results}, {("bottom", 1.3)}
+        )
+
+    def test_bands(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / "bands.pdf"
+            pdf = canvas.Canvas(str(path), pagesize=A4)
+            pdf.drawString(300, 20, "2024")
+            pdf.drawString(300, A4[1] - 30, "- 12 -")
+            pdf.drawString(300, A4[1] / 2, "7")
+            pdf.drawString(100, 40, "1" * 30)
+            pdf.save()
+            with pdfplumber.open(path) as document:
+                features = PageFeatures(document.pages[0])
+                found = PageNumberFinder(max_number=20).find(features)
+                unbounded = PageNumberFinder().find(features)
+
+        # the year is past the page count, the middle of the page and the
+        # wide run of digits are never page numbers
+        self.assertEqual([candidate["text"] for candidate in found["candidates"]], ["12"])
+        self.assertEqual(
+            (found["label"]["value"], found["label"]["position"], found["label"]["strictness"]),
+            (12, "top", "strict"),
+        )
+        self.assertEqual([candidate["value"] for candidate in unbounded["candidates"]], [2024, 12])
+
+
+class ColumnDetectorTest(SimpleTestCase):
+    """Gutters that run down the text split it into columns."""
+
+    def boxes(self, columns, lines=20):
+        # four words to a line in every column, 4pt apart
+        boxes = []
+        for line in range(lines):
+            top = 72 + line * 14
+            for x0, x1 in columns:
+                width = (x1 - x0 - 12) / 4
+                for word in range(4):
+                    left = x0 + word * (width + 4)
+                    boxes.append([left, top, left + width, top + 10])
+        return np.array(boxes, dtype=float)
+
+    def layout(self, boxes):
+        return ColumnDetector().layout(boxes, 612)
+
+    def test_layouts(self):
+        self.assertEqual(self.layout(self.boxes([(108, 540)]))["count"], 1)
+        two = self.layout(self.boxes([(108, 310), (340, 540)]))
+        self.assertEqual((two["count"], two["gutters"]), (2, [[310, 340]]))
+        self.assertEqual([column["words"] for column in two["columns"]], [80, 80])
+        three = self.layout(self.boxes([(72, 200), (226, 380), (406, 540)]))
+        self.assertEqual((three["count"], three["gutters"]), (3, [[200, 226], [380, 406]]))
+        self.assertEqual(self.layout(np.empty((0, 4)))["count"], 0)
+
+    def test_not_columns(self):
+        two = [(108, 310), (340, 540)]
+        # too few lines to trust, and more columns than a page layout has
+        self.assertEqual(self.layout(self.boxes(two, lines=3))["count"], 1)
+        self.assertEqual(self.layout(self.boxes([(72, 160), (180, 270), (290, 380), (400, 540)]))["count"], 1)
+        # a heading across the gutter and a short caption in the margin
+        boxes = np.vstack([self.boxes(two), [[108, 40, 540, 52]], [[560, 300, 590, 310]]])
+        layout = self.layout(boxes)
+        self.assertEqual((layout["count"], layout["gutters"]), (2, [[310, 340]]))
+        self.assertEqual([column["words"] for column in layout["columns"]], [81, 81])
+
+
+class PageSequenceTest(SimpleTestCase):
+    """The fitted numbering must survive front matter, gaps and strays."""
+
+    def results(self, pages):
+        results = []
+        for labels in pages:
+            candidates = [
+                dict(zip(("value", "style"), parse_page_number(label)), text=label)
+                for label in labels
+            ]
+            results.append(
+                {
+                    "page_label": candidates[0] if candidates else None,
+                    "page_label_candidates": candidates,
+                }
+            )
+        return results
+
+    def test_fit(self):
+        pages = [["i"], ["ii"], ["iii"], [], ["1"], ["2", "40"], [], ["4"], ["4"], ["5"]]
+        pages += [["6"], ["2"], ["8"], ["10"], ["11"]]
+        results = self.results(pages)
+        report = fit_page_numbers(results)
+
+        self.assertEqual(
+            [result["page_sequence"]["status"] for result in results],
+            ["ok", "ok", "ok", "unnumbered", "ok", "ok", "missing", "ok", "duplicate", "ok"]
+            + ["ok", "out_of_order", "ok", "ok", "ok"],
+        )
+        self.assertEqual(
+            [(run["first"], run["last"]) for run in report["runs"]],
+            [("i", "iii"), ("1", "4"), ("4", "8"), ("10", "11")],
+        )
+        self.assertEqual(report["missing"], [{"page_number": 7, "expected": "3"}])
+        self.assertEqual(report["duplicated"], [{"label": "4", "pages": [8, 9]}])
+        self.assertEqual(
+            report["out_of_order"], [{"page_number": 12, "label": "2", "expected": "7"}]
+        )
+        self.assertEqual(report["skipped"], ["9"])
+
+
+@override_settings(ANALYSIS_JOB_LEASE=60, ANALYSIS_JOB_RETRY_DELAY=30)
+class JobQueueTest(TestCase):
+    """Jobs are run once at a time, retried with backoff and reclaimed."""
+
+    def setUp(self):
+        self.review_request = create_review_request()
+        self.job = self.review_request.jobs.get()
+
+    def expire_lease(self):
+        AnalysisJob.objects.filter(pk=self.job.pk).update(
+            locked_at=timezone.now() - timedelta(seconds=61)
+        )
+
+    def test_claim_race(self):
+        # both workers read the job as runnable before either claims it
+        now = timezone.now()
+        (candidate,) = runnable_jobs(now)
+        self.assertTrue(claim_job("a", *candidate, now))
+        self.assertFalse(claim_job("b", *candidate, now))
+        self.assertIsNone(claim_next_job("b"))
+
+        job = AnalysisJob.objects.get(pk=self.job.pk)
+        self.assertEqual((job.status, job.locked_by, job.attempts), (AnalysisJob.PROCESSING, "a", 1))
+
+    def test_retry_backoff(self):
+        job = claim_next_job("a")
+        with mock.patch("core.jobs.analyse_review_request", side_effect=ValueError), self.assertLogs(
+            "core.jobs", level="ERROR"
+        ):
+            run_job(job)
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, job.locked_by), (AnalysisJob.PENDING, 1, ""))
+        self.assertIn("ValueError", job.error)
+        self.assertAlmostEqual(
+            (job.run_after - timezone.now()).total_seconds(), 30, delta=5
+        )
+        self.assertIsNone(claim_next_job("a"))
+
+        AnalysisJob.objects.filter(pk=job.pk).update(run_after=timezone.now())
+        job = claim_next_job("a")
+        self.assertEqual(job.attempts, 2)
+        with mock.patch("core.jobs.analyse_review_request", side_effect=ValueError), self.assertLogs(
+            "core.jobs", level="ERROR"
+        ):
+            run_job(job)
+        job.refresh_from_db()
+        self.assertAlmostEqual(
+            (job.run_after - timezone.now()).total_seconds(), 60, delta=5
+        )
+
+    def test_stale_lease_reclaimed(self):
+        first = claim_next_job("a")
+        self.assertIsNone(claim_next_job("b"))
+        self.assertTrue(renew_lease(first))
+
+        self.expire_lease()
+        second = claim_next_job("b")
+        self.assertEqual((second.locked_by, second.attempts), ("b", 2))
+
+        # the first worker comes back after losing its lease
+        self.assertFalse(renew_lease(first))
+        with self.assertLogs("core.jobs", level="WARNING"):
+            self.assertFalse(finish_job(first, AnalysisJob.COMPLETED))
+        job = AnalysisJob.objects.get(pk=self.job.pk)
+        self.assertEqual((job.status, job.locked_by), (AnalysisJob.PROCESSING, "b"))
+
+        self.assertTrue(finish_job(second, AnalysisJob.COMPLETED))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.locked_by), (AnalysisJob.COMPLETED, ""))
+        self.review_request.refresh_from_db()
+        self.assertEqual(self.review_request.status, AnalysisJob.COMPLETED)
+
+
+@override_settings(ANALYSIS_CACHE_ENABLED=True, ANALYSIS_JOB_LEASE=3)
+class ConcurrentWorkTest(TransactionTestCase):
+    """Worker threads sharing a database never fail each other's jobs."""
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        media = override_settings(MEDIA_ROOT=media_root.name)
+        media.enable()
+        self.addCleanup(media.disable)
+
+    def test_concurrent_workers(self):
+        with tempfile.TemporaryDirectory() as directory:
+            for seed in range(6):
+                path = Path(directory) / f"{seed}.pdf"
+                generate_document(path, pages=4, seed=seed)
+                create_review_request(document=ContentFile(path.read_bytes(), name=path.name))
+
+        with self.assertLogs("core", level="INFO"), self.assertLogs("services", level="INFO"):
+            work(concurrency=2, burst=True, poll_interval=0.1)
+
+        jobs = AnalysisJob.objects.all()
+        self.assertEqual(len(jobs), 6)
+        for job in jobs:
+            self.assertEqual((job.status, job.attempts, job.error), (AnalysisJob.COMPLETED, 1, ""))
+
+
+class SavePageResultsTest(TestCase):
+    """Re-analysing a request updates its page rows in place."""
+
+    def setUp(self):
+        self.review_request = create_review_request()
+
+    def results(self, count, violations=()):
+        return [
+            {
+                "page_number": page_number,
+                "inside_borders": not violations,
+                "is_blank": False,
+                "violations": list(violations),
+            }
+            for page_number in range(1, count + 1)
+        ]
+
+    def rows(self):
+        return PageResult.objects.filter(review_request=self.review_request).order_by("page_number")
+
+    def test_rerun_updates_in_place(self):
+        save_page_results(self.review_request, self.results(3), fingerprints=["a", "b", "c"])
+        ids = list(self.rows().values_list("pk", flat=True))
+
+        # a retried job stores the same pages again
+        save_page_results(
+            self.review_request, self.results(3, ["left"]), fingerprints=["a", "b", "d"]
+        )
+        self.assertEqual(list(self.rows().values_list("pk", flat=True)), ids)
+        self.assertEqual(
+            list(self.rows().values_list("flaged", "fingerprint")),
+            [(True, "a"), (True, "b"), (True, "d")],
+        )
+        self.assertEqual(self.rows().first().details["violations"], ["left"])
+
+    def test_shorter_document_removes_pages(self):
+        save_page_results(self.review_request, self.results(5))
+        save_page_results(self.review_request, self.results(2), batch_size=1)
+        self.assertEqual(list(self.rows().values_list("page_number", flat=True)), [1, 2])
+
+    def test_engines_kept_apart(self):
+        save_page_results(self.review_request, self.results(2))
+        save_page_results(self.review_request, self.results(1), service="fitz")
+        self.assertEqual(self.rows().filter(service="plumber").count(), 2)
+        self.assertEqual(self.rows().filter(service="fitz").count(), 1)
+
+
+class SaveOutputTest(TestCase):
+    """The annotated PDF reaches the storage through a spool file, byte for byte."""
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        media = override_settings(MEDIA_ROOT=media_root.name)
+        media.enable()
+        self.addCleanup(media.disable)
+
+    @override_settings(OUTPUT_SPOOL_MAX_SIZE=1024)
+    def test_spooled_to_disk(self):
+        review_request = create_review_request()
+        with self.assertLogs("services", level="INFO"):
+            analyzer = PlumberAnalyzer(str(DATA_DIR / "paper3.pdf"))
+        expected = io.BytesIO()
+        analyzer.write_output(expected)
+
+        spools = []
+        spooled_file = tempfile.SpooledTemporaryFile
+
+        def spool(*args, **kwargs):
+            spools.append(spooled_file(*args, **kwargs))
+            return spools[-1]
+
+        with mock.patch("core.analysis.tempfile.SpooledTemporaryFile", side_effect=spool):
+            save_output(review_request, analyzer)
+
+        # past OUTPUT_SPOOL_MAX_SIZE the spool rolled over to a file on disk
+        self.assertGreater(len(expected.getvalue()), 1024)
+        self.assertTrue(spools[0]._rolled)
+        self.assertTrue(spools[0].closed)
+        review_request.refresh_from_db()
+        self.assertEqual(review_request.output.name, f"output/{review_request.id}_output.pdf")
+        with review_request.output.open("rb") as output:
+            self.assertEqual(output.read(), expected.getvalue())
+
+
+class PeakRSSTest(SimpleTestCase):
+    def test_peak_is_per_block(self):
+        if not reset_peak_rss():
+            self.skipTest("the RSS high-water mark can't be reset here")
+        with PeakRSS() as large:
+            buffer = bytearray(64 * 1024 * 1024)
+            buffer[:: 4096] = b"x" * len(buffer[:: 4096])
+            del buffer
+        with PeakRSS() as small:
+            pass
+        self.assertGreater(large.peak - small.peak, 32 * 1024 * 1024)
+
+
+@override_settings(ANALYSIS_CACHE_ENABLED=True, ANALYSIS_CACHE_EVICT_INTERVAL=3600)
+class AnalysisCacheTest(TestCase):
+    """Entries are served while their output exists and evicted least recently used first."""
+
+    results = [{"page_number": 1, "violations": []}]
+
+    def setUp(self):
+        self.review_request = create_review_request()
+        cache._last_eviction = None
+
+    def store(self, fingerprint, output=""):
+        self.review_request.output.name = output
+        store_analysis(fingerprint, self.review_request, self.results, ["a"])
+        return AnalysisCache.objects.get(fingerprint=fingerprint)
+
+    def test_hit(self):
+        self.store("document")
+        entry = get_cached_analysis("document")
+        self.assertEqual((entry.results, entry.page_fingerprints), (self.results, ["a"]))
+        get_cached_analysis("document")
+        self.assertEqual(AnalysisCache.objects.get(fingerprint="document").hits, 2)
+
+    def test_config_salt_miss(self):
+        engine = get_engine("plumber")
+        path = DATA_DIR / "paper3.pdf"
+        fingerprint = document_fingerprint(path, analysis_config(DEFAULT_PROFILE, engine))
+        self.store(fingerprint)
+
+        wider = DEFAULT_PROFILE.replace(left=DEFAULT_PROFILE.left + 1)
+        self.assertIsNone(get_cached_analysis(document_fingerprint(path, analysis_config(wider, engine))))
+        self.assertIsNotNone(
+            get_cached_analysis(document_fingerprint(path, analysis_config(DEFAULT_PROFILE, engine)))
+        )
+
+    def test_missing_output_dropped(self):
+        self.store("document", output="output/removed_output.pdf")
+        self.assertIsNone(get_cached_analysis("document"))
+        self.assertFalse(AnalysisCache.objects.filter(fingerprint="document").exists())
+
+    @override_settings(ANALYSIS_CACHE_MAX_ENTRIES=2, ANALYSIS_CACHE_MAX_AGE=30)
+    def test_eviction_order(self):
+        now = timezone.now()
+        for fingerprint, age in (("expired", 31), ("old", 3), ("recent", 2), ("newest", 1)):
+            self.store(fingerprint)
+            AnalysisCache.objects.filter(fingerprint=fingerprint).update(
+                last_used_at=now - timedelta(days=age)
+            )
+        # a hit makes an entry the most recently used
+        get_cached_analysis("old")
+
+        self.assertEqual(evict_analysis_cache(), 2)
+        self.assertEqual(
+            sorted(AnalysisCache.objects.values_list("fingerprint", flat=True)), ["newest", "old"]
+        )
+
+    def test_eviction_throttled(self):
+        with mock.patch("core.cache.evict_analysis_cache", return_value=0) as evict:
+            self.store("first")
+            self.store("second")
+        self.assertEqual(evict.call_count, 1)
+
+        with override_settings(ANALYSIS_CACHE_EVICT_INTERVAL=0), mock.patch(
+            "core.cache.evict_analysis_cache"
+        ) as evict:
+            cache._last_eviction = None
+            self.store("third")
+        evict.assert_not_called()
+
+    def test_command(self):
+        self.store("expired")
+        AnalysisCache.objects.update(last_used_at=timezone.now() - timedelta(days=31))
+        self.store("fresh")
+        # the request from setUp missed, two more hit
+        AnalysisJob.objects.update(cache_hit=False)
+        for _ in range(2):
+            create_review_request().jobs.update(cache_hit=True)
+
+        output = io.StringIO()
+        call_command("analysis_cache", evict=True, stdout=output)
+        self.assertEqual(
+            output.getvalue().splitlines(),
+            ["Evicted 1 cache entries", "Entries: 1", "Hits: 2", "Misses: 1", "Hit rate: 66.7%"],
+        )
+
+        output = io.StringIO()
+        call_command("analysis_cache", clear=True, stdout=output)
+        self.assertEqual(output.getvalue().splitlines()[:2], ["Removed 1 cache entries", "Entries: 0"])
+        self.assertFalse(AnalysisCache.objects.exists())
+
+
+class MarginProfileTest(TestCase):
+    """Requests are checked against the profile registered under their name now."""
+
+    def setUp(self):
+        # profiles registered by the test are dropped again afterwards
+        profiles = mock.patch.dict("services.margin_profile._profiles")
+        profiles.start()
+        self.addCleanup(profiles.stop)
+
+    def test_reregistered_profile(self):
+        review_request = create_review_request(margin_profile="thesis")
+        register_profile("thesis", MarginProfile.from_inches(1, 1, 1, 1))
+        before = review_request.get_margin_profile()
+        register_profile("thesis", MarginProfile.from_inches(2, 1, 1, 1))
+        after = review_request.get_margin_profile()
+
+        self.assertEqual((before.name, after.name), ("thesis", "thesis"))
+        self.assertEqual(before.limits(*A4).tolist(), [72, 72, A4[0] - 72, A4[1] - 72])
+        self.assertEqual(after.limits(*A4).tolist(), [144, 72, A4[0] - 72, A4[1] - 72])
+        engine = review_request.get_engine()
+        self.assertNotEqual(analysis_config(before, engine), analysis_config(after, engine))
+
+    def test_side_overrides(self):
+        register_profile("thesis", MarginProfile.from_inches(1, 1, 1, 1))
+        review_request = create_review_request(margin_profile="thesis", left_margin=2, bottom_margin=0.5)
+        self.assertEqual(review_request.get_margin_profile().margins, (144, 72, 72, 36))
+        self.assertEqual(create_review_request().get_margin_profile(), DEFAULT_PROFILE)
+
+    def test_unknown_profile(self):
+        review_request = create_review_request(margin_profile="missing")
+        with self.assertRaises(ValueError):
+            review_request.get_margin_profile()
+
+
+@override_settings(ANALYSIS_CACHE_ENABLED=False)
+class RevisionTest(TestCase):
+    """A revision only re-checks the pages that changed since its parent."""
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        media = override_settings(MEDIA_ROOT=media_root.name)
+        media.enable()
+        self.addCleanup(media.disable)
+
+    def document(self, name, pages):
+        writer = PdfWriter()
+        for document, index in pages:
+            writer.add_page(PdfReader(DATA_DIR / document).pages[index])
+        output = io.BytesIO()
+        writer.write(output)
+        return ContentFile(output.getvalue(), name=name)
+
+    def output_contents(self, output):
+        # the overlay writer always leaves /Contents an array of streams
+        return [
+            b"".join(stream.get_object().get_data() for stream in page["/Contents"])
+            for page in PdfReader(output).pages
+        ]
+
+    def test_only_changed_page_checked(self):
+        parent = create_review_request(
+            document=self.document("parent.pdf", [("paper3.pdf", index) for index in range(6)])
+        )
+        # the first two pages swap places and the last one is replaced
+        revision = create_review_request(
+            parent=parent,
+            document=self.document(
+                "revision.pdf",
+                [("paper3.pdf", index) for index in (1, 0, 2, 3, 4)] + [("landscape2.pdf", 0)],
+            ),
+        )
+        with self.assertLogs("services", level="INFO"):
+            analyse_review_request(parent)
+            report = analyse_review_request(revision)
+            fresh = PlumberAnalyzer(revision.document.path)
+
+        self.assertEqual((report["stats"]["pages_checked"], report["stats"]["pages_reused"]), (1, 5))
+        stored = PageResult.objects.filter(review_request=revision).order_by("page_number")
+        self.assertEqual([row.details for row in stored], fresh.results)
+
+        expected = io.BytesIO()
+        fresh.write_output(expected)
+        with revision.output.open("rb") as output:
+            self.assertEqual(self.output_contents(output), self.output_contents(expected))
+
+
+@override_settings(ANALYSIS_CACHE_ENABLED=False)
+class SharedDocumentTest(TestCase):
+    """A fitz job checks the document its fingerprints were read from."""
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        media = override_settings(MEDIA_ROOT=media_root.name)
+        media.enable()
+        self.addCleanup(media.disable)
+
+    def test_opened_once(self):
+        review_request = create_review_request(
+            document=ContentFile((DATA_DIR / "paper3.pdf").read_bytes(), name="paper3.pdf"),
+            engine="fitz",
+        )
+        with mock.patch("fitz.open", wraps=fitz.open) as opened, self.assertLogs("services", level="INFO"):
+            report = analyse_review_request(review_request)
+        opened.assert_called_once_with(review_request.document.path)
+        self.assertEqual(report["stats"]["pages_checked"], 11)
+
+
+class SyntheticDocumentsTest(TestCase):
+    """The generator command writes the same documents for the same seeds."""
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        media = override_settings(MEDIA_ROOT=media_root.name)
+        media.enable()
+        self.addCleanup(media.disable)
+
+    def generate(self, directory, **options):
+        call_command("synthetic_documents", str(directory), pages=3, stdout=io.StringIO(), **options)
+        return {path.name: path.read_bytes() for path in sorted(Path(directory).iterdir())}
+
+    def test_documents(self):
+        reviewer = User.objects.create_user("reviewer@example.com", "password", phone="0000000000")
+        with tempfile.TemporaryDirectory() as first, tempfile.TemporaryDirectory() as second:
+            files = self.generate(first, count=2, seed=5, submit="0000000000")
+            self.assertEqual(self.generate(second, count=2, seed=5), files)
+
+        self.assertEqual(
+            sorted(files),
+            ["synthetic-3-5.json", "synthetic-3-5.pdf", "synthetic-3-6.json", "synthetic-3-6.pdf"],
+        )
+        self.assertEqual(
+            [page["page_number"] for page in json.loads(files["synthetic-3-5.json"])], [1, 2, 3]
+        )
+        self.assertNotEqual(files["synthetic-3-5.pdf"], files["synthetic-3-6.pdf"])
+
+        # every submitted document is queued for analysis
+        submitted = ReviewRequest.objects.filter(reviewer=reviewer)
+        self.assertEqual(submitted.count(), 2)
+        self.assertEqual(AnalysisJob.objects.filter(review_request__in=submitted).count(), 2)
+        with submitted.order_by("created_at").first().document.open("rb") as document:
+            self.assertEqual(document.read(), files["synthetic-3-5.pdf"])
+
+    def test_unknown_reviewer(self):
+        with tempfile.TemporaryDirectory() as directory, self.assertRaises(CommandError):
+            self.generate(directory, submit="0000000000")
+
+
+class DocumentSessionTest(SimpleTestCase):
+    """main.py reads every page through one session and streams the results."""
+
+    path = DATA_DIR / "paper3.pdf"
+
+    def test_handles_closed(self):
+        with mock.patch("fitz.open", wraps=fitz.open) as opened:
+            with DocumentSession(str(self.path)) as session:
+                results = list(page_results(session))
+                pdf, document = session.pdf, session.document
+        opened.assert_called_once_with(str(self.path))
+        self.assertEqual([result["page_number"] for result in results], list(range(1, 12)))
+        self.assertTrue(pdf.stream.closed)
+        self.assertTrue(document.is_closed)
+
+    def test_jsonl(self):
+        with DocumentSession(str(self.path)) as session:
+            expected = [json.loads(json.dumps(result)) for result in page_results(session)]
+        output = subprocess.run(
+            [sys.executable, "main.py", str(self.path), "--jsonl"],
+            cwd=settings.BASE_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        self.assertEqual([json.loads(line) for line in output.splitlines()], expected)
+
+
+class BenchmarkRunTest(TestCase):
+    """A benchmark run leaves nothing in the database or the storage."""
+
+    def test_nothing_stored(self):
+        with mock.patch.object(
+            default_storage, "save", side_effect=AssertionError("saved to the default storage")
+        ), self.assertLogs("services", level="INFO"):
+            run = benchmark_run(DATA_DIR / "paper3.pdf", "plumber", 1)
+
+        self.assertEqual((run["document"], run["pages"]), ("paper3.pdf", 11))
+        self.assertGreater(run["timings"]["persist"], 0)
+        self.assertFalse(ReviewRequest.objects.exists())
+        self.assertFalse(PageResult.objects.exists())
+
+
+class MarginCheckTest(SimpleTestCase):
+    """The loop for a few boxes reports exactly what the array check does."""
+
+    def test_paths_agree(self):
+        limits = DEFAULT_PROFILE.limits(612, 792)
+        rng = np.random.default_rng(0)
+        for count in (0, 1, 5, VECTORISE_MIN_BOXES, 200):
+            with self.subTest(count=count):
+                x0 = rng.uniform(60, 560, count)
+                top = rng.uniform(40, 760, count)
+                boxes = np.stack([x0, top, x0 + rng.uniform(5, 80, count), top + 10], axis=1)
+                report = check_margins_array(boxes, limits)
+                self.assertEqual(check_margins_loop(boxes, limits), report)
+                self.assertEqual(check_margins(boxes, limits), report)
+                if count >= VECTORISE_MIN_BOXES:
+                    self.assertFalse(report["inside"])
+
+
+class OverlayTest(SimpleTestCase):
+    """Margin overlays are built once and written once per document."""
+
+    def test_margin_overlay(self):
+        overlay = margin_overlay(DEFAULT_PROFILE, PageGeometry((0, 0, 600, 800)), (1, 0, 0))
+        self.assertEqual(overlay, b"\nq 1 0 0 RG 108 72 420 656 re S Q\n")
+        # an equal geometry hits the cache
+        self.assertIs(margin_overlay(DEFAULT_PROFILE, PageGeometry((0, 0, 600, 800)), (1, 0, 0)), overlay)
+        # turned a quarter clockwise, the 1.5 inch left margin runs along the media box bottom
+        rotated = margin_overlay(DEFAULT_PROFILE, PageGeometry((0, 0, 800, 600), rotation=90), (1, 0, 0))
+        self.assertEqual(rotated, b"\nq 1 0 0 RG 72 108 656 420 re S Q\n")
+
+    def test_streams_shared(self):
+        reader = PdfReader(DATA_DIR / "paper3.pdf")
+        writer = PdfWriter()
+        overlay_writer = OverlayWriter(writer)
+        overlay = margin_overlay(DEFAULT_PROFILE, PageGeometry.from_pypdf(reader.pages[0]), (1, 0, 0))
+        for page in reader.pages[:2]:
+            overlay_writer.add_page(page, [overlay])
+
+        first, second = (page["/Contents"] for page in writer.pages)
+        self.assertEqual(first[0].idnum, second[0].idnum)
+        self.assertEqual(first[-1].idnum, second[-1].idnum)
+
+        output = io.BytesIO()
+        writer.write(output)
+        for source, page in zip(reader.pages, PdfReader(output).pages):
+            streams = [stream.get_object().get_data() for stream in page["/Contents"]]
+            self.assertEqual((streams[0], streams[-2], streams[-1]), (b"q\n", b"\nQ\n", overlay))
+            self.assertEqual(b"".join(streams[1:-2]), source.get_contents().get_data())
+
+
+class AnnotatedOutputTest(SimpleTestCase):
+    """The output has one page per flagged page, carrying all of its overlays."""
+
+    def overlays(self, page):
+        # the streams after the original content's closing Q
+        streams = [stream.get_object().get_data() for stream in page["/Contents"]]
+        restore = streams.index(b"\nQ\n")
+        return b"".join(streams[1:restore]), streams[restore + 1:]
+
+    def test_one_page_per_flagged_page(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / "flagged.pdf"
+            generate_document(path, pages=8, seed=0, violation_rate=0.4, blank_rate=0.2)
+            with self.assertLogs("services", level="INFO"):
+                analyzer = PlumberAnalyzer(str(path))
+            source = PdfReader(path)
+            output = io.BytesIO()
+            analyzer.write_output(output)
+
+            flagged = [result for result in analyzer.results if result["violations"]]
+            pages = PdfReader(output).pages
+            self.assertEqual([result["page_number"] for result in flagged], [1, 5, 7, 8])
+            self.assertEqual((analyzer.annotated_pages, len(pages)), (4, 4))
+            for result, page in zip(flagged, pages):
+                with self.subTest(page=result["page_number"]):
+                    original = source.pages[result["page_number"] - 1]
+                    content, overlays = self.overlays(page)
+                    self.assertEqual(content, original.get_contents().get_data())
+                    self.assertEqual(overlays, analyzer.annotations(original, result))
+
+            # a text violation gets the red rectangle and its lines outlined,
+            # a blank page only the blue rectangle
+            geometry = PageGeometry.from_pypdf(source.pages[0])
+            text, blank = self.overlays(pages[0])[1], self.overlays(pages[3])[1]
+            self.assertEqual(text[0], margin_overlay(DEFAULT_PROFILE, geometry, (1, 0, 0)))
+            self.assertTrue(text[1].startswith(b"\nq 1 0.5 0 RG"))
+            self.assertEqual(blank, [margin_overlay(DEFAULT_PROFILE, geometry, (0, 0, 1))])
+
+    def test_violations_combined(self):
+        page = PdfReader(DATA_DIR / "paper3.pdf").pages[0]
+        with self.assertLogs("services", level="INFO"):
+            analyzer = PlumberAnalyzer(str(DATA_DIR / "paper3.pdf"))
+        geometry = PageGeometry.from_pypdf(page)
+        result = {
+            "violations": ["text", "images", "blank"],
+            "margins": {"text": {"boxes": [[10, 10, 40, 20]]}, "images": {"boxes": [[20, 700, 90, 760]]}},
+        }
+        # text and images share the red rectangle, and every box is outlined in one stream
+        self.assertEqual(
+            analyzer.annotations(page, result),
+            [
+                margin_overlay(DEFAULT_PROFILE, geometry, (1, 0, 0)),
+                margin_overlay(DEFAULT_PROFILE, geometry, (0, 0, 1)),
+                box_highlights([[10, 10, 40, 20], [20, 700, 90, 760]], geometry, HIGHLIGHT_COLOR),
+            ],
+        )
+
+
+class CoverageGridTest(SimpleTestCase):
+    """Coverage is the area of the union of the boxes, at any cell size."""
+
+    def test_rectangle_area(self):
+        # edges off the grid lines in both directions, and one box in a cell
+        boxes = np.array([[10.3, 20.7, 110.9, 33.1], [300.25, 400.5, 300.75, 401.25]])
+        area = 100.6 * 12.4 + 0.5 * 0.75
+        for cell_size in (1, 2, 3.7, 50):
+            with self.subTest(cell_size=cell_size):
+                self.assertAlmostEqual(
+                    CoverageGrid(cell_size).coverage(boxes, 612, 792),
+                    area / (612 * 792) * 100,
+                    places=3,
+                )
+
+    def test_union(self):
+        grid = CoverageGrid()
+        # two overlapping squares and one past the bottom right page corner
+        boxes = np.array([[10, 10, 50, 50], [30, 30, 70, 70], [600, 780, 650, 800]])
+        area = 40 * 40 * 2 - 20 * 20 + 12 * 12
+        self.assertAlmostEqual(grid.coverage(boxes, 612, 792), area / (612 * 792) * 100, places=3)
+        self.assertEqual(grid.coverage(np.empty((0, 4)), 612, 792), 0)
+        self.assertEqual(grid.coverage(np.array([[-5, -5, 700, 900]]), 612, 792), 100)
+
+
+class ProfileCaptureTest(SimpleTestCase):
+    def test_overlapping_memory_captures(self):
+        first = ProfileCapture(memory=True)
+        second = ProfileCapture(memory=True)
+        first.__enter__()
+        second.__enter__()
+        # as with two jobs in worker threads, the first one finishes first
+        first.__exit__(None, None, None)
+        self.assertTrue(tracemalloc.is_tracing())
+        second.__exit__(None, None, None)
+        self.assertFalse(tracemalloc.is_tracing())
+        for capture in (first, second):
+            self.assertIn("Traced memory", capture.report)
+
+
+class PageGeometryTest(SimpleTestCase):
+    """Both engines put a word where it is displayed, whatever the page boxes."""
+
+    # (media box, crop box, rotation)
+    PAGES = (
+        ((0, 0, 612, 792), None, 0),
+        ((0, 0, 612, 792), (30, 40, 580, 760), 0),
+        ((-50, -50, 612, 792), (-20, -20, 600, 780), 0),
+        ((-50, -50, 612, 792), (-20, -20, 600, 780), 90),
+        ((-50, -50, 612, 792), (-20, -20, 600, 780), 180),
+        ((100, 100, 712, 892), None, 270),
+        ((100, 100, 712, 892), (150, 120, 700, 880), 90),
+        ((0, 0, 612, 792), (30, 40, 580, 760), 270),
+    )
+    # where the word starts, from the top left corner of the unrotated crop box
+    OFFSET = (200, 150)
+
+    def document(self, mediabox, cropbox, rotation):
+        writer = PdfWriter()
+        writer.add_blank_page(612, 792)
+        page = writer.pages[0]
+        font = DictionaryObject(
+            {
+                NameObject("/Type"): NameObject("/Font"),
+                NameObject("/Subtype"): NameObject("/Type1"),
+                NameObject("/BaseFont"): NameObject("/Helvetica"),
+            }
+        )
+        page[NameObject("/Resources")] = DictionaryObject(
+            {NameObject("/Font"): DictionaryObject({NameObject("/F1"): writer._add_object(font)})}
+        )
+        crop = cropbox or mediabox
+        content = DecodedStreamObject()
+        content.set_data(
+            f"BT /F1 12 Tf {crop[0] + self.OFFSET[0]} {crop[3] - self.OFFSET[1]} Td "
+            "(Margin) Tj ET".encode()
+        )
+        page[NameObject("/Contents")] = writer._add_object(content)
+        page.mediabox = RectangleObject(mediabox)
+        if cropbox:
+            page.cropbox = RectangleObject(cropbox)
+        page[NameObject("/Rotate")] = NumberObject(rotation)
+        output = io.BytesIO()
+        writer.write(output)
+        return output.getvalue()
+
+    def features(self, data):
+        with pdfplumber.open(io.BytesIO(data)) as pdf:
+            plumber = PageFeatures(pdf.pages[0])
+        with fitz.open(stream=data) as document:
+            mupdf = FitzPageFeatures(document[0])
+        return plumber, mupdf
+
+    def displayed(self, box, width, height, rotation):
+        """`box` on an unrotated width x height page, as shown after rotation."""
+        x0, top, x1, bottom = box
+        return {
+            0: (x0, top, x1, bottom),
+            90: (height - bottom, x0, height - top, x1),
+            180: (width - x1, height - bottom, width - x0, height - top),
+            270: (top, width - x1, bottom, width - x0),
+        }[rotation]
+
+    def test_word_boxes(self):
+        unrotated, _ = self.features(self.document((0, 0, 612, 792), None, 0))
+        word = unrotated.word_boxes[0]
+        for mediabox, cropbox, rotation in self.PAGES:
+            with self.subTest(mediabox=mediabox, cropbox=cropbox, rotation=rotation):
+                x0, y0, x1, y1 = cropbox or mediabox
+                expected = self.displayed(word, x1 - x0, y1 - y0, rotation)
+                plumber, mupdf = self.features(self.document(mediabox, cropbox, rotation))
+                self.assertEqual((plumber.width, plumber.height), (mupdf.width, mupdf.height))
+                np.testing.assert_allclose(plumber.word_boxes[0], expected, atol=0.01)
+                # MuPDF's boxes take the full font ascent and descent
+                np.testing.assert_allclose(mupdf.word_boxes[0], expected, atol=4)
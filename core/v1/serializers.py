@@ -1,6 +1,8 @@
 from django.utils.translation import gettext_lazy as _
 from rest_framework import serializers
 from core.models import ReviewRequest, PageResult
+from services.engines import engine_names
+from services.margin_profile import profile_names
 
 
 class ReviewRequestSerializer(serializers.ModelSerializer):
@@ -8,14 +10,46 @@ class ReviewRequestSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = ReviewRequest
-        fields = ["id", "document", "reviewer", "document_name", "output", "status", "created_at"]
+        fields = [
+            "id",
+            "document",
+            "reviewer",
+            "document_name",
+            "output",
+            "status",
+            "page_numbering",
+            "margin_profile",
+            "engine",
+            "top_margin",
+            "bottom_margin",
+            "left_margin",
+            "right_margin",
+            "created_at",
+        ]
+        read_only_fields = ["page_numbering"]
 
     def get_document_name(self, obj):
         return obj.document.name.split("/")[-1]
 
+    def validate_margin_profile(self, value):
+        if value and value not in profile_names():
+            raise serializers.ValidationError(
+                _("Unknown margin profile. Choose one of: %s") % ", ".join(profile_names())
+            )
+        return value
+
+    def validate_engine(self, value):
+        if value and value not in engine_names():
+            raise serializers.ValidationError(
+                _("Unknown analysis engine. Choose one of: %s") % ", ".join(engine_names())
+            )
+        return value
+
 
 class PageResultSerializer(serializers.ModelSerializer):
     details = serializers.SerializerMethodField()
+    page_label = serializers.SerializerMethodField()
+    columns = serializers.SerializerMethodField()
 
     class Meta:
         model = PageResult
@@ -26,6 +60,8 @@ class PageResultSerializer(serializers.ModelSerializer):
             "flaged",
             "service",
             "details",
+            "page_label",
+            "columns",
             "created_at",
         ]
         read_only_fields = ["created_at"]
@@ -42,3 +78,13 @@ class PageResultSerializer(serializers.ModelSerializer):
             errors["margins_not_followed"] = _("Data is outside the borders")
 
         return errors
+
+    def get_page_label(self, obj):
+        # the page number printed on the page, None when there is none
+        label = obj.details.get("page_label")
+        return label["text"] if label else None
+
+    def get_columns(self, obj):
+        # text columns on the page, None for results from before the stage
+        columns = obj.details.get("columns")
+        return columns["count"] if columns else None
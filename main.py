@@ -5,9 +5,16 @@ import PyPDF2
 # import json
 import simplejson as json
 import re
+import sys
 import fitz
 import numpy as np
 
+from services.columns import ColumnDetector
+from services.geometry import PageGeometry
+
+COLUMN_DETECTOR = ColumnDetector()
+COLUMN_LAYOUTS = {1: 'Single Column', 2: 'Double Column', 3: 'Triple Column'}
+
 
 def get_pdf_margins(pdf):
     pdf_margins = {}
@@ -56,49 +63,54 @@ def blank_pages(pdf):
     return blank_pages
 
 
-def get_page_margins(page):
-    return page.mediabox.left, page.mediabox.bottom, page.mediabox.right, page.mediabox.top
+def get_page_margins(session, page_num):
+    mediabox = session.pdf.pages[page_num].mediabox
+    return mediabox.left, mediabox.bottom, mediabox.right, mediabox.top
 
 
-def is_blank_page(page):
-    text = page.extract_text()
+def is_blank_page(session, page_num):
+    text = session.page_text(page_num)
     # we have to check for empty string, whitespace and newline characters and also
     # if there's only page number in the page then it's also considered as blank
     return not text or text.isspace() or text == '\n' or text.isdigit()
 
-def is_single_side_page(page):
-    return page.mediabox.left == 0 and page.mediabox.bottom == 0
+def is_single_side_page(session, page_num):
+    mediabox = session.pdf.pages[page_num].mediabox
+    return mediabox.left == 0 and mediabox.bottom == 0
 
-def is_double_side_page(page):
-    return page.mediabox.left != 0 and page.mediabox.bottom != 0
+def is_double_side_page(session, page_num):
+    mediabox = session.pdf.pages[page_num].mediabox
+    return mediabox.left != 0 and mediabox.bottom != 0
 
-def is_page_numbered(page):
-    return page.extract_text().isdigit()
+def is_page_numbered(session, page_num):
+    return session.page_text(page_num).isdigit()
 
-def is_landscaped(page):
-    return page.mediabox.left > page.mediabox.bottom
+def is_landscaped(session, page_num):
+    # the crop box as displayed, after /Rotate
+    return session.geometry(page_num).landscape
 
-def is_portraited(page):
-    return page.mediabox.left < page.mediabox.bottom
+def is_portraited(session, page_num):
+    geometry = session.geometry(page_num)
+    return geometry.width < geometry.height
 
 # def get_page_orientation(page):
 #     if page.mediabox.left > page.mediabox.bottom:
 #         return 'landscape'
 #     return 'portrait'
 
-def get_text_percentage(page):
-    text = page.extract_text()
+def get_text_percentage(session, page_num):
+    text = session.page_text(page_num)
     if not text:
         return 0
-    return len(text) / (page.mediabox.right * page.mediabox.top)
+    geometry = session.geometry(page_num)
+    return len(text) / (geometry.width * geometry.height)
 
 def gte_number_of_columns(page):
     pass
 
 
-def get_page_orientation(pdf_path, page_number):
-    document = fitz.open(pdf_path)
-    page = document.load_page(page_number)
+def get_page_orientation(session, page_number):
+    page = session.document.load_page(page_number)
     rotation = page.rotation
 
     if rotation == 0:
@@ -115,83 +127,137 @@ def get_page_orientation(pdf_path, page_number):
     return orientation
 
 
-def get_text_blocks(page):
-    """Extract text blocks from a page."""
-    blocks = page.get_text("blocks")
-    return blocks
-
-def determine_column_layout(blocks, page_width):
-    """Determine if the page layout is single or double column based on text blocks."""
-    columns = []
-
-    # Classify each block as left, center, or right
-    for block in blocks:
-        x0, y0, x1, y1, _, _, _, _ = block
-        mid_x = (x0 + x1) / 2
-
-        if mid_x < page_width / 3:
-            columns.append("left")
-        elif mid_x > 2 * page_width / 3:
-            columns.append("right")
-        else:
-            columns.append("center")
-
-    # Count the number of left, center, and right blocks
-    left_count = columns.count("left")
-    center_count = columns.count("center")
-    right_count = columns.count("right")
-
-    # Heuristic: if there are more left and right blocks than center blocks, it's likely double column
-    if left_count > 0 and right_count > 0 and center_count < left_count + right_count:
-        return "Double Column"
-    else:
-        return "Single Column"
+def get_text_boxes(page):
+    """(n, 4) array of the x0, y0, x1, y1 of the words on a page, as displayed."""
+    # words come in unrotated coordinates, page.rect is the rotated page
+    words = page.get_text("words")
+    return np.array(
+        [tuple(fitz.Rect(word[:4]) * page.rotation_matrix) for word in words], dtype=float
+    ).reshape(-1, 4)
 
-def get_page_column_layout(pdf_path, page_number):
-    # Open the PDF file
-    document = fitz.open(pdf_path)
+def determine_column_layout(boxes, page_width):
+    """Determine the page layout (single, double or triple column) from its word boxes."""
+    count = COLUMN_DETECTOR.layout(boxes, page_width)["count"]
+    return COLUMN_LAYOUTS.get(count, "Single Column")
 
-    # Select the page
-    page = document.load_page(page_number)
+def get_page_column_layout(session, page_number):
+    page = session.document.load_page(page_number)
 
     # Get the width of the page
     page_width = page.rect.width
 
-    # Extract text blocks
-    blocks = get_text_blocks(page)
+    # Extract the word boxes
+    boxes = get_text_boxes(page)
 
     # Determine the column layout
-    layout = determine_column_layout(blocks, page_width)
+    layout = determine_column_layout(boxes, page_width)
     return layout
 
 
-if __name__ == '__main__':
-    pdf_file = input("Enter the pdf file path: ")
-    pdf = PyPDF2.PdfReader(pdf_file)
-    # pdf_margins = get_pdf_margins(pdf)
-    # print(pdf_margins)
-    # print('-----------------------------------')
-    # print(page_numbers_and_coordinates(pdf))
-    # print('-----------------------------------')
-    # print(blank_pages(pdf))
-    results = []
-    for page_num in range(len(pdf.pages)):
-        page = pdf.pages[page_num]
-        results.append({
+class DocumentSession:
+    """
+    One PDF shared by all of the per-page helpers above. The PyPDF2 reader
+    and the fitz document are each opened on first use and at most once,
+    and both are closed when the session is, so use it as a context manager:
+
+        with DocumentSession("thesis.pdf") as session:
+            for result in page_results(session):
+                ...
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._pdf = None
+        self._document = None
+        # the extracted text of the last page asked for; the blank, page
+        # number and text percentage checks all read the same page's text
+        self._text_page = None
+        self._text = None
+        self._geometry_page = None
+        self._geometry = None
+
+    @property
+    def pdf(self):
+        if self._pdf is None:
+            self._pdf = PyPDF2.PdfReader(self.path)
+        return self._pdf
+
+    @property
+    def document(self):
+        if self._document is None:
+            self._document = fitz.open(self.path)
+        return self._document
+
+    @property
+    def page_count(self):
+        return len(self.pdf.pages)
+
+    def page_text(self, page_num):
+        if self._text_page != page_num:
+            self._text = self.pdf.pages[page_num].extract_text()
+            self._text_page = page_num
+        return self._text
+
+    def geometry(self, page_num):
+        if self._geometry_page != page_num:
+            self._geometry = PageGeometry.from_pypdf(self.pdf.pages[page_num])
+            self._geometry_page = page_num
+        return self._geometry
+
+    def close(self):
+        if self._document is not None:
+            self._document.close()
+            self._document = None
+        if self._pdf is not None:
+            self._pdf.stream.close()
+            self._pdf = None
+        self._text_page = self._text = None
+        self._geometry_page = self._geometry = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.close()
+        return False
+
+
+def page_results(session):
+    """Yield the metrics of each page as soon as the page is done."""
+    for page_num in range(session.page_count):
+        yield {
             'page_number': page_num + 1,
-            'margins': get_page_margins(page),
-            'is_blank': is_blank_page(page),
-            'is_single_side': is_single_side_page(page),
-            'is_double_side': is_double_side_page(page),
-            'is_page_numbered': is_page_numbered(page),
-            'is_landscaped': is_landscaped(page),
-            'is_portraited': is_portraited(page),
-            # 'orientation': get_page_orientation(page),
-            'orientation': get_page_orientation(pdf_file, page_num),
-            # 'text_blocks': get_page_column_layout(pdf_file, page_num),
-            'text_percentage': get_text_percentage(page)
-        })
-
-    print('-----------------------------------')
-    # print('Results:', results)
-    print(json.dumps(results, indent=4))
+            'margins': get_page_margins(session, page_num),
+            'is_blank': is_blank_page(session, page_num),
+            'is_single_side': is_single_side_page(session, page_num),
+            'is_double_side': is_double_side_page(session, page_num),
+            'is_page_numbered': is_page_numbered(session, page_num),
+            'is_landscaped': is_landscaped(session, page_num),
+            'is_portraited': is_portraited(session, page_num),
+            'orientation': get_page_orientation(session, page_num),
+            'column_layout': get_page_column_layout(session, page_num),
+            'text_percentage': get_text_percentage(session, page_num)
+        }
+
+
+if __name__ == '__main__':
+    # python main.py [file.pdf] [--jsonl]; --jsonl prints one JSON object per
+    # page as it is done instead of the whole list at the end
+    args = [arg for arg in sys.argv[1:] if arg != '--jsonl']
+    json_lines = '--jsonl' in sys.argv[1:]
+    pdf_file = args[0] if args else input("Enter the pdf file path: ")
+    with DocumentSession(pdf_file) as session:
+        # pdf_margins = get_pdf_margins(session.pdf)
+        # print(pdf_margins)
+        # print('-----------------------------------')
+        # print(page_numbers_and_coordinates(session.pdf))
+        # print('-----------------------------------')
+        # print(blank_pages(session.pdf))
+        if json_lines:
+            for result in page_results(session):
+                print(json.dumps(result), flush=True)
+        else:
+            results = list(page_results(session))
+            print('-----------------------------------')
+            # print('Results:', results)
+            print(json.dumps(results, indent=4))
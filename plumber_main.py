@@ -2,44 +2,24 @@ import pdfplumber
 from reportlab.pdfgen import canvas
 from io import BytesIO
 from PyPDF2 import PdfReader, PdfWriter, PdfMerger, PageObject
-import re
+
+from services.page_features import PageFeatures
+from services.page_numbers import PAGE_COUNT_SLACK, PageNumberFinder
+from services.page_sequence import fit_page_numbers
 
 
 INCH_TO_POINTS = 72
 LEFT_MARGIN_POINTS = 1.5 * INCH_TO_POINTS
-MARGIN = 1.1 * INCH_TO_POINTS
-
-
-def is_roman_numeral(s):
-    pattern = re.compile(r'^M{0,4}(CM|CD|D?C{0,3})(XC|XL|L?X{0,3})(IX|IV|V?I{0,3})$', re.IGNORECASE)
-    return bool(pattern.match(s))
-
-def determine_page_number_location(y, height):
-    if y < MARGIN:
-        return "top"
-    elif y > height - MARGIN:
-        return "bottom"
-    return None
-
-def is_likely_page_number(text, page_index, total_pages, actual_first_page):
-    # if page_index == 11:
-    #     breakpoint()
-    if text.isdigit():
-        num = int(text)
-        expected_num = page_index - actual_first_page + 1
-        return 1 <= num <= total_pages and abs(num - expected_num) <= 2
-    elif is_roman_numeral(text):
-        return len(text) <= 4
-    return False
 
 
 if __name__ == "__main__":
     output = PdfWriter()
     pdf_reader = PdfReader("data/Test_Doc4_1.pdf")
-    actual_first_page = 10 # considers 0th index as first page
 
     with pdfplumber.open("data/Test_Doc4_1.pdf") as pdf:
         total_pages = len(pdf.pages)
+        finder = PageNumberFinder(max_number=total_pages + PAGE_COUNT_SLACK)
+        results = []
         for i, page in enumerate(pdf.pages):
             # is the page blank?
             text = page.extract_text()
@@ -49,33 +29,33 @@ if __name__ == "__main__":
             is_blank = not text or whitespace or newline or only_page_number
             print(f"Page {i + 1} is blank: {is_blank}")
 
-            # does the page has page number printed on it?
-            words = page.extract_words()
-            height = page.height
-            
-            first_word = words[0] if words else None
-            last_word = words[-1] if words else None
-            
-            page_number = None
-            page_number_location = None
-
-            for word in [first_word, last_word]:
-                if word and is_likely_page_number(word['text'], i + 1, total_pages, actual_first_page):
-                    location = determine_page_number_location(word['top'], height)
-                    if location:
-                        page_number = word['text']
-                        page_number_location = location
-                        break
-
-            print(f"Page {i + 1}:")
-            if page_number:
-                print(f"  Page number found: Yes")
-                print(f"  Page number: {page_number}")
-                print(f"  Page number type: {'digit' if page_number.isdigit() else 'roman'}")
-                print(f"  Page number location: {page_number_location}")
-            else:
-                print(f"  Page number found: No")
-
-
-
-            
\ No newline at end of file
+            # candidate page numbers in the margins, fitted below
+            page_numbers = finder.find(PageFeatures(page))
+            results.append({
+                "page_number": i + 1,
+                "page_label": page_numbers["label"],
+                "page_label_candidates": page_numbers["candidates"],
+            })
+
+    # the numbering is fitted over the whole document, so the first
+    # numbered page no longer has to be known up front
+    report = fit_page_numbers(results)
+    for result in results:
+        sequence = result["page_sequence"]
+        print(f"Page {result['page_number']}:")
+        if sequence["found"]:
+            label = result["page_label"]
+            print(f"  Page number found: Yes")
+            print(f"  Page number: {sequence['found']}")
+            if label:
+                print(f"  Page number type: {'digit' if label['style'] == 'arabic' else 'roman'}")
+                print(f"  Page number location: {label['position']}")
+        else:
+            print(f"  Page number found: No")
+        print(f"  Expected page number: {sequence['expected']} ({sequence['status']})")
+
+    for run in report["runs"]:
+        print(f"Pages {run['start_page']}-{run['end_page']}: {run['style']} {run['first']}-{run['last']}")
+    for issue in ("missing", "duplicated", "out_of_order", "skipped"):
+        if report[issue]:
+            print(f"{issue.replace('_', ' ').capitalize()}: {report[issue]}")
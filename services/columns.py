@@ -0,0 +1,95 @@
+import numpy as np
+
+# resolution, in points, of the x coverage histogram
+BIN_WIDTH = 2
+# a gutter is at least this wide; the space between two words is far less
+MIN_GUTTER = 12
+# bins covered by at most this share of the busiest bin still count as
+# empty, so headings and page numbers running across a gutter don't hide it
+GUTTER_FILL = 0.05
+# fewer lines than this can't tell a gutter from words that happen to line up
+MIN_LINES = 5
+# a column holds at least this share of the words, narrower strips are
+# captions or marginal notes belonging to a neighbour
+MIN_COLUMN_SHARE = 0.1
+# more columns than this is tabular content, not a column layout
+MAX_COLUMNS = 3
+
+
+class ColumnDetector:
+    """
+    Finds the text columns of a page from the word boxes the margin checks
+    already extracted.
+
+    Every word adds one to the bins of an x coverage histogram it spans,
+    built in one pass with bincount over the word starts and ends. Runs of
+    (nearly) empty bins inside the text are the gutters, and the word
+    centroids are assigned to the columns between them with searchsorted,
+    so a page costs a few array operations however many words it has.
+    """
+
+    def __init__(self, bin_width=BIN_WIDTH, min_gutter=MIN_GUTTER, min_lines=MIN_LINES):
+        self.bin_width = bin_width
+        self.min_gutter = min_gutter
+        self.min_lines = min_lines
+
+    def detect(self, features):
+        return self.layout(features.word_boxes, features.width)
+
+    def layout(self, boxes, width):
+        """
+        Return {"count", "gutters", "columns"} for an (n, 4) array of
+        x0/top/x1/bottom boxes: the gutters as [x0, x1] and the columns as
+        {"x0", "x1", "words"}, in points from the left edge.
+        """
+        if not len(boxes):
+            return {"count": 0, "gutters": [], "columns": []}
+
+        bins = int(np.ceil(max(width, boxes[:, 2].max()) / self.bin_width)) + 1
+        starts = np.clip(np.floor(boxes[:, 0] / self.bin_width).astype(int), 0, bins)
+        ends = np.clip(np.ceil(boxes[:, 2] / self.bin_width).astype(int), 0, bins)
+        coverage = np.cumsum(
+            np.bincount(starts, minlength=bins + 1) - np.bincount(ends, minlength=bins + 1)
+        )[:bins]
+
+        covered = np.flatnonzero(coverage)
+        first, last = int(covered[0]), int(covered[-1]) + 1
+        gutters = []
+        if coverage.max() >= self.min_lines:
+            empty = coverage[first:last] <= coverage.max() * GUTTER_FILL
+            edges = np.flatnonzero(np.diff(np.concatenate(([0], empty.astype(np.int8), [0]))))
+            for start, end in (edges.reshape(-1, 2) + first).tolist():
+                if (end - start) * self.bin_width >= self.min_gutter:
+                    gutters.append((start, end))
+
+        centroids = (boxes[:, 0] + boxes[:, 2]) / 2
+        counts = self.column_counts(centroids, gutters)
+        # merge strips too sparse to be a column into their smaller neighbour
+        while gutters and counts.min() < MIN_COLUMN_SHARE * len(boxes):
+            column = int(counts.argmin())
+            if column == 0:
+                gutter = 0
+            elif column == len(gutters):
+                gutter = column - 1
+            else:
+                gutter = column - 1 if counts[column - 1] <= counts[column + 1] else column
+            del gutters[gutter]
+            counts = self.column_counts(centroids, gutters)
+        if len(gutters) >= MAX_COLUMNS:
+            gutters = []
+            counts = np.array([len(boxes)])
+
+        lefts = [first] + [end for _, end in gutters]
+        rights = [start for start, _ in gutters] + [last]
+        return {
+            "count": len(gutters) + 1,
+            "gutters": [[start * self.bin_width, end * self.bin_width] for start, end in gutters],
+            "columns": [
+                {"x0": left * self.bin_width, "x1": right * self.bin_width, "words": words}
+                for left, right, words in zip(lefts, rights, counts.tolist())
+            ],
+        }
+
+    def column_counts(self, centroids, gutters):
+        centres = [(start + end) / 2 * self.bin_width for start, end in gutters]
+        return np.bincount(np.searchsorted(centres, centroids), minlength=len(gutters) + 1)
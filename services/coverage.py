@@ -0,0 +1,91 @@
+import math
+
+import numpy as np
+
+# side of a grid cell in points: 2 points is finer than the gap between
+# two lines of body text, so the lines don't merge into one block
+DEFAULT_CELL_SIZE = 2.0
+# cells per page at most; larger pages get coarser cells, so memory and
+# time stay bounded whatever the page size
+MAX_CELLS = 500_000
+
+
+class CoverageGrid:
+    """
+    Measures how much of a page the text covers by rasterising its word
+    boxes onto a coarse occupancy grid.
+
+    Every cell holds the share of its area the boxes cover, so a box's
+    edges count for the part of the cell they actually reach and a single
+    box measures its exact area at any cell size. Overlapping boxes are
+    counted once inside the cells they both fill, unlike summing their
+    areas; only where they overlap within a partly covered cell can the
+    union come out slightly high.
+
+    A box's coverage is the outer product of its coverage of the columns and
+    of the rows, so its 2D difference array is the outer product of the two
+    1D ones: sixteen entries per box, written for all of them with a single
+    bincount, and two cumulative sums turn them into the coverage of every
+    cell. The cost is linear in the number of boxes plus the number of
+    cells, however many glyphs a page holds.
+    """
+
+    def __init__(self, cell_size=DEFAULT_CELL_SIZE):
+        self.cell_size = float(cell_size or DEFAULT_CELL_SIZE)
+
+    def grid_shape(self, width, height):
+        cell_size = max(self.cell_size, math.sqrt(width * height / MAX_CELLS))
+        return cell_size, max(1, math.ceil(height / cell_size)), max(1, math.ceil(width / cell_size))
+
+    def occupancy(self, boxes, width, height):
+        """A (rows, columns) grid of the share of each cell the boxes cover."""
+        cell_size, rows, columns = self.grid_shape(width, height)
+        if not len(boxes):
+            return np.zeros((rows, columns))
+
+        # boxes past the page edge are clipped to it
+        boxes = np.clip(boxes, 0, [width, height, width, height])
+        columns_index, columns_difference = edge_differences(
+            boxes[:, 0] / cell_size, boxes[:, 2] / cell_size
+        )
+        rows_index, rows_difference = edge_differences(
+            boxes[:, 1] / cell_size, boxes[:, 3] / cell_size
+        )
+
+        stride = columns + 2
+        corners = rows_index[:, :, None] * stride + columns_index[:, None, :]
+        weights = rows_difference[:, :, None] * columns_difference[:, None, :]
+        difference = np.bincount(
+            corners.ravel(), weights=weights.ravel(), minlength=(rows + 2) * stride
+        )
+        covered = difference.reshape(rows + 2, stride).cumsum(axis=0).cumsum(axis=1)
+        # overlapping boxes add up past a full cell; the clip also drops the
+        # rounding error the sums leave in empty cells
+        return np.clip(covered[:rows, :columns], 0, 1)
+
+    def coverage(self, boxes, width, height):
+        """Percentage of the page area covered by the union of the boxes."""
+        if width <= 0 or height <= 0:
+            return 0.0
+        cell_size, _, _ = self.grid_shape(width, height)
+        # the last row and column of cells may reach past the page edge
+        area = self.occupancy(boxes, width, height).sum() * cell_size * cell_size
+        return round(float(area / (width * height)) * 100, 4)
+
+
+def edge_differences(start, end):
+    """
+    The 1D difference arrays of the boxes spanning `start` to `end`, in cells.
+
+    A box covers (c + 1) - start of its first cell c, all of the cells up to
+    its last one and end - e of its last cell e (end - start when that is
+    the same cell). Returned as (n, 4) cell indices and (n, 4) differences
+    at them, which sum to 0 for every box.
+    """
+    first = np.floor(start)
+    last = np.floor(end)
+    head = first + 1 - start
+    tail = end - last
+    index = np.stack([first, first + 1, last, last + 1], axis=1).astype(np.intp)
+    difference = np.stack([head, 1 - head, tail - 1, -tail], axis=1)
+    return index, difference
@@ -0,0 +1,16 @@
+from services.fitz_analyzer import FitzAnalyzer
+from services.plumber_analyzer import PlumberAnalyzer
+
+# analysis engines by name; every engine produces the same result schema
+_engines = {engine.name: engine for engine in (PlumberAnalyzer, FitzAnalyzer)}
+
+
+def get_engine(name):
+    try:
+        return _engines[name]
+    except KeyError:
+        raise ValueError(f"Unknown analysis engine {name!r}")
+
+
+def engine_names():
+    return sorted(_engines)
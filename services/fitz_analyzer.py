@@ -1,72 +1,188 @@
 import fitz
-import re
-
-from core.models import PageResult
-
-class FitsAnalyzer:
-    def __init__(self, pdf_path, review_request):
-        self.pdf = fitz.open(pdf_path)
-        self.analysis = {}
-        self.analyse()
-        self.save_results(review_request)
-
-    def save_results(self, review_request):
-        for page_num, details in self.analysis.items():
-            PageResult.objects.create(
-                review_request=review_request,
-                page_number=page_num,
-                service='fitz',
-                details=details
+from pdfplumber.table import (
+    TableSettings,
+    cells_to_tables,
+    edges_to_intersections,
+    intersections_to_cells,
+    merge_edges,
+)
+from pdfplumber.utils import filter_edges
+
+from services.geometry import PageGeometry
+from services.margins import boxes_array
+from services.plumber_analyzer import PageChecker, PlumberAnalyzer
+
+# get_text("blocks") marks image blocks with type 1
+TEXT_BLOCK = 0
+# pdfplumber's find_tables() defaults, so both engines agree on which pages
+# hold a table
+TABLE_SETTINGS = TableSettings.resolve(None)
+
+
+def drawing_edges(drawings):
+    """
+    The horizontal and vertical edges pdfplumber's table finder would take
+    from a page's get_cdrawings(): the sides of rectangles and quads, lines,
+    and every Bézier curve as the segment between its end points, which is
+    all pdfminer keeps of a curve. Points are plain (x, y) tuples.
+    """
+    edges = []
+    for drawing in drawings:
+        for item in drawing["items"]:
+            if item[0] == "l":
+                points = [item[1], item[2]]
+            elif item[0] == "c":
+                points = [item[1], item[4]]
+            elif item[0] == "re":
+                x0, y0, x1, y1 = item[1]
+                points = [(x0, y0), (x1, y0), (x1, y1), (x0, y1), (x0, y0)]
+            else:
+                upper_left, upper_right, lower_left, lower_right = item[1]
+                points = [upper_left, upper_right, lower_right, lower_left, upper_left]
+            for (start_x, start_y), (end_x, end_y) in zip(points, points[1:]):
+                if start_x == end_x:
+                    orientation = "v"
+                elif start_y == end_y:
+                    orientation = "h"
+                else:
+                    continue
+                x0, x1 = sorted((start_x, end_x))
+                top, bottom = sorted((start_y, end_y))
+                edges.append(
+                    {
+                        "x0": x0,
+                        "x1": x1,
+                        "top": top,
+                        "bottom": bottom,
+                        "width": x1 - x0,
+                        "height": bottom - top,
+                        "orientation": orientation,
+                    }
+                )
+    return edges
+
+
+def has_table(drawings):
+    """
+    Whether pdfplumber's find_tables() would find a table among these
+    drawings: its edge merging, intersection and cell steps run on the
+    edges MuPDF reports, without pdfplumber parsing the page.
+    """
+    settings = TABLE_SETTINGS
+    edges = merge_edges(
+        drawing_edges(drawings),
+        snap_x_tolerance=settings.snap_x_tolerance,
+        snap_y_tolerance=settings.snap_y_tolerance,
+        join_x_tolerance=settings.join_x_tolerance,
+        join_y_tolerance=settings.join_y_tolerance,
+    )
+    edges = filter_edges(edges, min_length=settings.edge_min_length)
+    intersections = edges_to_intersections(
+        edges, settings.intersection_x_tolerance, settings.intersection_y_tolerance
+    )
+    return bool(cells_to_tables(intersections_to_cells(intersections)))
+
+
+class FitzPageFeatures:
+    """
+    The PageFeatures record built from a PyMuPDF page, so the same checks
+    run on MuPDF's text extraction instead of pdfminer's layout analysis.
+
+    MuPDF reports words and images relative to the crop box but before
+    /Rotate, so their boxes are mapped through the page's rotation matrix
+    into the normalised coordinates of PageGeometry.
+    """
+
+    def __init__(self, page):
+        self.page_number = page.number + 1
+        self.geometry = PageGeometry.from_fitz(page)
+        self.width = self.geometry.width
+        self.height = self.geometry.height
+        rotation = page.rotation_matrix
+
+        # x0, y0, x1, y1, text, block_no, line_no, word_no
+        self.words = []
+        # block number -> line number -> words, in reading order
+        blocks = {}
+        for word in page.get_text("words"):
+            box = fitz.Rect(word[:4]) * rotation
+            self.words.append(
+                {"text": word[4], "x0": box.x0, "top": box.y0, "x1": box.x1, "bottom": box.y1}
             )
+            blocks.setdefault(word[5], {}).setdefault(word[6], []).append(word[4])
+        self.images = []
+        for image in page.get_image_info():
+            box = fitz.Rect(image["bbox"]) * rotation
+            self.images.append({"x0": box.x0, "top": box.y0, "x1": box.x1, "bottom": box.y1})
+        self.word_boxes = boxes_array(self.words)
+        self.image_boxes = boxes_array(self.images)
+
+        # pdfplumber's extract_text() is one line per text line with single
+        # spaces between words; rebuild it the same way from the words of
+        # each text block so the blank and page number checks agree
+        block_numbers = [
+            block[5] for block in page.get_text("blocks") if block[6] == TEXT_BLOCK
+        ]
+        self.text = "\n".join(
+            " ".join(words)
+            for block_number in block_numbers
+            for words in blocks.get(block_number, {}).values()
+        )
+        self.stripped_text = self.text.strip()
+        self._page = page
+        self._drawings = None
+        self._has_tables = None
+
+    @property
+    def has_content(self):
+        # whether the page draws anything, as pdfplumber's page.objects: a
+        # content stream that only sets up state (reportlab's blank pages)
+        # is empty too. Only asked for near-empty pages, so tracing their
+        # text, spaces and invisible text included, costs next to nothing
+        return bool(self._page.get_texttrace() or self.images or self.drawings)
+
+    @property
+    def drawings(self):
+        if self._drawings is None:
+            # the C-level paths: no Point/Rect objects, about twice as fast
+            self._drawings = self._page.get_cdrawings()
+        return self._drawings
+
+    @property
+    def has_ruling_lines(self):
+        return bool(self.drawings)
+
+    @property
+    def has_tables(self):
+        # only asked for near-empty pages, so the vector graphics are never
+        # walked for pages with text
+        if self._has_tables is None:
+            self._has_tables = bool(self.drawings) and has_table(self.drawings)
+        return self._has_tables
+
+
+class FitzPageChecker(PageChecker):
+    features_class = FitzPageFeatures
+
+    def open(self, input_path, page_numbers=None):
+        return fitz.open(input_path)
+
+    def can_check(self, document):
+        return isinstance(document, fitz.Document)
+
+    def page_count(self, document):
+        return document.page_count
+
+    def document_pages(self, document, page_numbers):
+        for page_number in page_numbers:
+            yield document[page_number - 1]
+
+
+class FitzAnalyzer(PlumberAnalyzer):
+    """
+    PlumberAnalyzer with the pages checked by PyMuPDF. Results use the same
+    schema and the output is annotated the same way.
+    """
 
-    def analyse(self):
-        for page_num in range(len(self.pdf.pages)):
-            page = self.pdf.pages[page_num]
-            self.analysis[page_num] = {
-                'margins': self.get_page_margins(page),
-                'is_blank': self.is_blank_page(page),
-                'is_single_side': self.is_single_side_page(page),
-                'is_double_side': self.is_double_side_page(page),
-                'side': 'single' if self.is_single_side_page(page) else 'double',
-                'is_page_numbered': self.is_page_numbered(page),
-                'page_number_coordinates': self.page_numbers_and_coordinates(page),
-                'is_landscaped': self.is_landscaped(page),
-                'is_portraited': self.is_portraited(page),
-                'orientation': 'landscape' if self.is_landscaped(page) else 'portrait',
-                'text_percentage': self.get_text_percentage(page)
-            }
-
-    def get_page_margins(self, page):
-        return page.mediabox.left, page.mediabox.bottom, page.mediabox.right, page.mediabox.top
-
-    def is_blank_page(self, page):
-        text = page.extract_text()
-        return not text or text.isspace() or text == '\n' or text.isdigit()
-
-    def is_single_side_page(self, page):
-        return page.mediabox.left == 0 and page.mediabox.bottom == 0
-
-    def is_double_side_page(self, page):
-        return page.mediabox.left != 0 and page.mediabox.bottom != 0
-
-    def is_page_numbered(self, page):
-        text = page.extract_text()
-        lat_lon_pattern = re.compile(r'([-+]?\d{1,2}\.\d+),\s*([-+]?\d{1,3}\.\d+)')
-        matches = lat_lon_pattern.findall(text)
-        return bool(matches)
-
-    def page_numbers_and_coordinates(self, page):
-        lat_lon_pattern = re.compile(r'([-+]?\d{1,2}\.\d+),\s*([-+]?\d{1,3}\.\d+)')
-        text = page.extract_text()
-        matches = lat_lon_pattern.findall(text)
-        return matches
-
-    def is_landscaped(self, page):
-        return page.mediabox.right > page.mediabox.top
-
-    def is_portraited(self, page):
-        return page.mediabox.right < page.mediabox.top
-
-    def get_text_percentage(self, page):
-        text = page.extract_text()
-        return len(text) / (page.mediabox.right * page.mediabox.top) * 100
+    name = "fitz"
+    checker_class = FitzPageChecker
@@ -0,0 +1,130 @@
+import numpy as np
+from pdfplumber.utils import resolve_all
+
+# for each /Rotate, the matrix taking a point of the displayed page (top-left
+# origin, y down) to PDF user space, and the media box corner it starts from
+ROTATIONS = {
+    0: (np.array([[1.0, 0.0], [0.0, -1.0]]), (0, 3)),
+    90: (np.array([[0.0, 1.0], [1.0, 0.0]]), (0, 1)),
+    180: (np.array([[-1.0, 0.0], [0.0, 1.0]]), (2, 1)),
+    270: (np.array([[0.0, -1.0], [-1.0, 0.0]]), (2, 3)),
+}
+
+
+class PageGeometry:
+    """
+    The effective page of a PDF page: its crop box as displayed, after
+    /Rotate, with the origin at the top left.
+
+    Every check works in these normalised coordinates, so margins are
+    measured from the edges a reader sees whatever the media box, crop box
+    and rotation of the page. The geometry is built once per page from the
+    raw boxes; `normalise` moves an engine's boxes into it (they are
+    relative to the rotated media box) and `pdf_rects` takes boxes back to
+    unrotated PDF user space to draw the overlays, each in one matrix
+    operation over all of the boxes.
+
+    `origin` is where the top-left corner of the rotated media box lies in
+    the coordinates of the boxes `normalise` is given.
+    """
+
+    def __init__(self, mediabox, cropbox=None, rotation=0, origin=(0, 0)):
+        self.mediabox = ordered(mediabox)
+        cropbox = self.mediabox if cropbox is None else ordered(cropbox)
+        # a crop box reaching outside the media box is clipped to it
+        self.cropbox = (
+            max(cropbox[0], self.mediabox[0]),
+            max(cropbox[1], self.mediabox[1]),
+            min(cropbox[2], self.mediabox[2]),
+            min(cropbox[3], self.mediabox[3]),
+        )
+        self.rotation = int(rotation) % 360
+        if self.rotation not in ROTATIONS:
+            self.rotation = 0
+
+        matrix, corner = ROTATIONS[self.rotation]
+        self.matrix = matrix
+        media_origin = np.array([self.mediabox[corner[0]], self.mediabox[corner[1]]])
+        x0, top, x1, bottom = self._display_box(self.cropbox, media_origin)
+        self.width = x1 - x0
+        self.height = bottom - top
+        # engine box -> normalised box
+        self.offset = np.array([x0 + origin[0], top + origin[1]] * 2, dtype=float)
+        self.offset.flags.writeable = False
+        # normalised point -> PDF user space
+        self.translation = media_origin + matrix @ np.array([x0, top])
+
+    @classmethod
+    def from_pdfplumber(cls, page):
+        # pdfminer has already merged the boxes inherited from the page tree
+        attrs = page.page_obj.attrs
+        # pdfplumber moves pdfminer's boxes, which start at the rotated
+        # media box corner, by the corner of its own page.mediabox: back to
+        # user space for x0, by the negated origin for `top`. Its cropbox is
+        # in that frame for unrotated pages only, so it isn't used.
+        return cls(
+            resolve_all(attrs["MediaBox"]),
+            resolve_all(attrs.get("CropBox")),
+            page.rotation,
+            origin=page.mediabox[:2],
+        )
+
+    @classmethod
+    def from_fitz(cls, page):
+        # MuPDF flips the crop box's y axis against the media box top
+        mediabox = tuple(page.mediabox)
+        cropbox = page.cropbox
+        top = mediabox[3]
+        return cls(mediabox, (cropbox.x0, top - cropbox.y1, cropbox.x1, top - cropbox.y0), page.rotation)
+
+    @classmethod
+    def from_pypdf(cls, page):
+        return cls(page.mediabox, page.cropbox, page.rotation)
+
+    @property
+    def landscape(self):
+        return self.width > self.height
+
+    @property
+    def key(self):
+        return (self.mediabox, self.cropbox, self.rotation)
+
+    def _display_box(self, box, media_origin):
+        # the matrices are orthogonal, so their transpose maps back
+        corners = (np.array([[box[0], box[1]], [box[2], box[3]]]) - media_origin) @ self.matrix
+        x0, top = corners.min(axis=0)
+        x1, bottom = corners.max(axis=0)
+        return float(x0), float(top), float(x1), float(bottom)
+
+    def normalise(self, boxes):
+        """pdfplumber x0/top/x1/bottom boxes, (n, 4), in page coordinates."""
+        return boxes - self.offset
+
+    def pdf_rects(self, boxes):
+        """
+        Normalised x0/top/x1/bottom boxes, (n, 4), as x/y/width/height
+        rectangles in unrotated PDF user space, ready for a `re` operator.
+        """
+        boxes = np.asarray(boxes, dtype=float).reshape(-1, 4)
+        first = boxes[:, :2] @ self.matrix.T + self.translation
+        second = boxes[:, 2:] @ self.matrix.T + self.translation
+        lower = np.minimum(first, second)
+        return np.hstack([lower, np.abs(second - first)])
+
+    def as_dict(self):
+        return {"width": round(self.width, 2), "height": round(self.height, 2), "rotation": self.rotation}
+
+    def __eq__(self, other):
+        return isinstance(other, PageGeometry) and self.key == other.key
+
+    def __hash__(self):
+        return hash(self.key)
+
+    def __repr__(self):
+        return f"PageGeometry({self.width:g}x{self.height:g}, rotated {self.rotation})"
+
+
+def ordered(box):
+    """A box as floats with its corners in lower-left, upper-right order."""
+    x0, y0, x1, y1 = (float(value) for value in box)
+    return (min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1))
@@ -0,0 +1,104 @@
+from functools import lru_cache
+
+import numpy as np
+
+INCH_TO_POINTS = 72
+
+
+class MarginProfile:
+    """
+    The margins a document is checked against, in points. Profiles are
+    immutable and hashable, so everything derived from a profile and a page
+    size is computed once per process and shared by every document that
+    uses them.
+    """
+
+    def __init__(self, left, top, right, bottom, name=None):
+        self.left = float(left)
+        self.top = float(top)
+        self.right = float(right)
+        self.bottom = float(bottom)
+        self.name = name
+
+    @classmethod
+    def from_inches(cls, left, top, right, bottom, name=None):
+        return cls(
+            left * INCH_TO_POINTS,
+            top * INCH_TO_POINTS,
+            right * INCH_TO_POINTS,
+            bottom * INCH_TO_POINTS,
+            name=name,
+        )
+
+    def replace(self, left=None, top=None, right=None, bottom=None):
+        """An unnamed copy with the given sides (in points) changed."""
+        return MarginProfile(
+            self.left if left is None else left,
+            self.top if top is None else top,
+            self.right if right is None else right,
+            self.bottom if bottom is None else bottom,
+        )
+
+    @property
+    def margins(self):
+        return (self.left, self.top, self.right, self.bottom)
+
+    def as_dict(self):
+        return {
+            "left_margin": self.left,
+            "top_margin": self.top,
+            "right_margin": self.right,
+            "bottom_margin": self.bottom,
+        }
+
+    def limits(self, page_width, page_height, tolerance=0):
+        return margin_limits(self, float(page_width), float(page_height), tolerance)
+
+    def __eq__(self, other):
+        return isinstance(other, MarginProfile) and self.margins == other.margins
+
+    def __hash__(self):
+        return hash(self.margins)
+
+    def __repr__(self):
+        return f"MarginProfile({self.name or 'custom'}: {self.margins})"
+
+
+@lru_cache(maxsize=256)
+def margin_limits(profile, page_width, page_height, tolerance=0):
+    """
+    The x0/top/x1/bottom limits boxes are checked against, as a read-only
+    array in pdfplumber's top-left origin coordinates.
+    """
+    limits = np.array(
+        [
+            profile.left - tolerance,
+            profile.top - tolerance,
+            page_width - profile.right + tolerance,
+            page_height - profile.bottom + tolerance,
+        ]
+    )
+    limits.flags.writeable = False
+    return limits
+
+
+DEFAULT_PROFILE = MarginProfile.from_inches(1.5, 1, 1, 1, name="default")
+
+_profiles = {DEFAULT_PROFILE.name: DEFAULT_PROFILE}
+
+
+def register_profile(name, profile):
+    profile.name = name
+    _profiles[name] = profile
+    return profile
+
+
+def get_profile(name):
+    try:
+        return _profiles[name]
+    except KeyError:
+        raise ValueError(f"Unknown margin profile {name!r}")
+
+
+def profile_names():
+    return sorted(_profiles)
@@ -0,0 +1,83 @@
+from itertools import chain
+from operator import itemgetter
+
+import numpy as np
+
+# columns of a boxes array, and the page side each one is checked against
+SIDES = ("left", "top", "right", "bottom")
+# x0/top overshoot when below their limit, x1/bottom when above it
+SIDE_SIGNS = np.array([-1.0, -1.0, 1.0, 1.0])
+# below this many boxes a plain loop beats the fixed cost (~15 µs a call) of
+# the array operations; they break even at 24-28 boxes. Image boxes and the
+# raster ink box nearly always are below it, text pages nearly never (see
+# analysis_benchmark --margins)
+VECTORISE_MIN_BOXES = 32
+
+_box_coordinates = itemgetter("x0", "top", "x1", "bottom")
+
+
+def boxes_array(objects):
+    """(n, 4) float array of x0, top, x1, bottom for pdfplumber objects."""
+    return np.fromiter(
+        chain.from_iterable(map(_box_coordinates, objects)),
+        dtype=float,
+        count=4 * len(objects),
+    ).reshape(-1, 4)
+
+
+def check_margins(boxes, limits):
+    """
+    Compare every box against the margins, with a plain loop for a few
+    boxes and array operations for more.
+
+    `boxes` is an (n, 4) array from boxes_array and `limits` the matching
+    x0/top/x1/bottom limits from MarginProfile.limits, both in pdfplumber's
+    top-left origin coordinates.
+
+    Returns a JSON-ready report: whether every box is inside, how many boxes
+    cross each side, the largest overshoot in points, and the indices and
+    boxes of the offending elements.
+    """
+    if len(boxes) < VECTORISE_MIN_BOXES:
+        return check_margins_loop(boxes, limits)
+    return check_margins_array(boxes, limits)
+
+
+def check_margins_array(boxes, limits):
+    """check_margins for many boxes, in one array operation over all of them."""
+    overshoot = (boxes - limits) * SIDE_SIGNS
+    outside = overshoot > 0
+    offending = outside.any(axis=1)
+    inside = not offending.any()
+    return {
+        "inside": inside,
+        "sides": dict(zip(SIDES, outside.sum(axis=0).tolist())),
+        "max_overshoot": 0.0 if inside else round(float(overshoot.max()), 2),
+        "indices": np.flatnonzero(offending).tolist(),
+        "boxes": boxes[offending].round(2).tolist(),
+    }
+
+
+def check_margins_loop(boxes, limits):
+    """check_margins for a handful of boxes, one box at a time."""
+    left, top, right, bottom = limits.tolist()
+    counts = [0, 0, 0, 0]
+    max_overshoot = 0.0
+    indices = []
+    for index, (x0, y0, x1, y1) in enumerate(boxes.tolist()):
+        outside = False
+        for side, overshoot in enumerate((left - x0, top - y0, x1 - right, y1 - bottom)):
+            if overshoot > 0:
+                counts[side] += 1
+                max_overshoot = max(max_overshoot, overshoot)
+                outside = True
+        if outside:
+            indices.append(index)
+    return {
+        "inside": not indices,
+        "sides": dict(zip(SIDES, counts)),
+        "max_overshoot": round(max_overshoot, 2),
+        "indices": indices,
+        # rounded the way the array path rounds them
+        "boxes": boxes[indices].round(2).tolist() if indices else [],
+    }
@@ -0,0 +1,82 @@
+from functools import lru_cache
+
+from PyPDF2.generic import (
+    ArrayObject,
+    DecodedStreamObject,
+    NameObject,
+)
+
+# the original page content is wrapped in q/Q so graphics state it leaves
+# behind (transforms, colours, clipping) cannot leak into the overlays
+SAVE_STATE = b"q\n"
+RESTORE_STATE = b"\nQ\n"
+
+
+def pdf_number(value):
+    # PDF has no exponent notation, so %g is not safe for small values
+    return ("%.4f" % value).rstrip("0").rstrip(".") or "0"
+
+
+@lru_cache(maxsize=512)
+def margin_overlay(profile, geometry, color):
+    """
+    Content stream bytes stroking the profile's margin rectangle in
+    `color`. Built once per process for each page geometry, profile and
+    colour.
+    """
+    rgb = " ".join(pdf_number(value) for value in color)
+    text_area = profile.limits(geometry.width, geometry.height)
+    rect = " ".join(pdf_number(value) for value in geometry.pdf_rects(text_area)[0])
+    return f"\nq {rgb} RG {rect} re S Q\n".encode()
+
+
+def box_highlights(boxes, geometry, color, line_width=0.75):
+    """
+    Content stream bytes outlining every box. `boxes` are x0, top, x1,
+    bottom in the page's normalised coordinates, mapped back to PDF space
+    through its PageGeometry.
+    """
+    rects = "\n".join(
+        " ".join(pdf_number(value) for value in rect) + " re"
+        for rect in geometry.pdf_rects(boxes).tolist()
+    )
+    rgb = " ".join(pdf_number(value) for value in color)
+    return f"\nq {rgb} RG {pdf_number(line_width)} w\n{rects}\nS Q\n".encode()
+
+
+class OverlayWriter:
+    """
+    Adds pages to a PdfWriter with overlay content streams appended to their
+    /Contents. Unlike PageObject.merge_page this never parses the original
+    content stream. Each distinct overlay is written to the output once and
+    referenced from every page that uses it, so the cached margin overlays
+    cost one object per document.
+    """
+
+    def __init__(self, writer):
+        self.writer = writer
+        self._streams = {}
+
+    def stream(self, data):
+        if data not in self._streams:
+            stream = DecodedStreamObject()
+            stream.set_data(data)
+            self._streams[data] = self.writer._add_object(stream)
+        return self._streams[data]
+
+    def add_page(self, page_obj, overlays):
+        page = self.writer.add_page(page_obj)
+        contents = page.raw_get("/Contents") if "/Contents" in page else None
+        resolved = contents.get_object() if contents is not None else None
+        if resolved is None:
+            original = []
+        elif isinstance(resolved, ArrayObject):
+            original = list(resolved)
+        else:
+            original = [contents]
+
+        page[NameObject("/Contents")] = ArrayObject(
+            [self.stream(SAVE_STATE), *original, self.stream(RESTORE_STATE)]
+            + [self.stream(overlay) for overlay in overlays]
+        )
+        return page
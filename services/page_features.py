@@ -0,0 +1,94 @@
+import time
+
+import pdfplumber
+
+from services.geometry import PageGeometry
+from services.margins import boxes_array
+
+# extract_text() calls the analyzer made per page before PageFeatures: five
+# for the blank test and text percentage, one printed, two in is_page_blank
+LEGACY_TEXT_PASSES = 8
+
+
+class PageFeatures:
+    """
+    Everything the page checks need, pulled out of a pdfplumber page once.
+
+    pdfplumber caches the pdfminer layout objects on the page, but every
+    extract_text()/extract_words() call re-runs the text layout on top of
+    them, so the analyzer builds this record once per page and all of the
+    checks read from it.
+    """
+
+    def __init__(self, page):
+        self.page_number = page.page_number
+        # boxes are normalised to the crop box as displayed, see PageGeometry
+        self.geometry = PageGeometry.from_pdfplumber(page)
+        self.width = self.geometry.width
+        self.height = self.geometry.height
+
+        self.chars = page.chars
+        self.words = page.extract_words()
+        self.images = [
+            {
+                "x0": image["x0"],
+                "top": image["top"],
+                "x1": image["x1"],
+                "bottom": image["bottom"],
+            }
+            for image in page.images
+        ]
+        # (n, 4) arrays for the vectorised margin checks
+        self.word_boxes = self.geometry.normalise(boxes_array(self.words))
+        self.image_boxes = self.geometry.normalise(boxes_array(self.images))
+        self.text = page.extract_text()
+        self.stripped_text = self.text.strip()
+
+        self._page = page
+        self._has_tables = None
+
+    @property
+    def has_content(self):
+        # the layout objects are already parsed for the text, so this is free
+        return any(self._page.objects.values())
+
+    @property
+    def has_ruling_lines(self):
+        # the lines, rectangles and curves are what pdfplumber's default
+        # table finder builds table edges from
+        return bool(self._page.lines or self._page.rects or self._page.curves)
+
+    @property
+    def has_tables(self):
+        # table finding is the most expensive pdfplumber call, so it only
+        # runs when a check actually asks and the page has ruling lines
+        if self._has_tables is None:
+            self._has_tables = self.has_ruling_lines and bool(self._page.find_tables())
+        return self._has_tables
+
+
+def legacy_page_pass(page):
+    """
+    The pdfplumber calls the analyzer made on every page before the
+    features were extracted once: each one re-runs the text layout.
+    """
+    for _ in range(LEGACY_TEXT_PASSES):
+        page.extract_text()
+    page.extract_words()
+    # once for the image margins and once in is_page_blank
+    page.images
+    page.images
+    page.extract_tables()
+
+
+def time_legacy_pass(input_path, page_numbers):
+    """
+    Seconds the old per-page calls take on the given 1-based pages, on a
+    fresh parse of the file so nothing cached by the analysis is reused.
+    """
+    started = time.perf_counter()
+    with pdfplumber.open(input_path, pages=page_numbers) as pdf:
+        for page in pdf.pages:
+            legacy_page_pass(page)
+            page.close()
+    return time.perf_counter() - started
@@ -0,0 +1,109 @@
+import hashlib
+import re
+
+import fitz
+
+# the page entries that decide what the page renders; structure tree,
+# metadata and piece info keys change when a document is re-saved
+RENDERING_KEYS = (
+    "Contents",
+    "Resources",
+    "MediaBox",
+    "CropBox",
+    "Rotate",
+    "UserUnit",
+)
+# page entries a page takes from its ancestors in the page tree when it
+# doesn't set them itself
+INHERITABLE_KEYS = ("Resources", "MediaBox", "CropBox", "Rotate")
+
+REFERENCE = re.compile(r"(\d+) \d+ R\b")
+# back references to the page tree would pull every page into each hash
+PARENT_REFERENCE = re.compile(r"/Parent\s+\d+\s+\d+\s+R\b")
+
+
+class PageFingerprinter:
+    """
+    Hashes what each page renders, following its content streams and
+    resources (fonts, images, form XObjects) down to their raw stream bytes.
+    Two pages with the same fingerprint render identically, so their check
+    results can be reused between revisions of a document.
+
+    The objects are read through MuPDF, which only loads the objects it is
+    asked for, without decoding their streams. Indirect objects are hashed
+    once per document, so resources shared by many pages cost nothing after
+    the first page that uses them.
+    """
+
+    def __init__(self, salt=b""):
+        self.salt = salt
+        self._document = None
+        self._indirect_digests = {}
+
+    def fingerprints(self, document):
+        """`document` is a file path or an already open fitz Document."""
+        if not isinstance(document, fitz.Document):
+            with fitz.open(document) as opened:
+                return self.fingerprints(opened)
+
+        self._document = document
+        self._indirect_digests = {}
+        return [
+            self.page_fingerprint(document.page_xref(index))
+            for index in range(document.page_count)
+        ]
+
+    def page_fingerprint(self, xref):
+        digest = hashlib.sha256(self.salt)
+        for key in RENDERING_KEYS:
+            value = self._page_entry(xref, key)
+            if value is None:
+                continue
+            digest.update(key.encode())
+            digest.update(self._digest_source(value))
+        return digest.hexdigest()
+
+    def _page_entry(self, xref, key):
+        seen = set()
+        while xref not in seen:
+            seen.add(xref)
+            kind, value = self._document.xref_get_key(xref, key)
+            if kind != "null":
+                return value
+            if key not in INHERITABLE_KEYS:
+                return None
+            kind, parent = self._document.xref_get_key(xref, "Parent")
+            if kind != "xref":
+                return None
+            xref = int(parent.split()[0])
+        return None
+
+    def _digest_source(self, source):
+        """Digest of PDF object source, each reference hashed as its object."""
+        digest = hashlib.sha256()
+        source = PARENT_REFERENCE.sub("", source)
+        position = 0
+        for reference in REFERENCE.finditer(source):
+            digest.update(source[position : reference.start()].encode())
+            digest.update(self._digest(int(reference[1])))
+            position = reference.end()
+        digest.update(source[position:].encode())
+        return digest.digest()
+
+    def _digest(self, xref):
+        if xref not in self._indirect_digests:
+            if not 0 < xref < self._document.xref_length():
+                return b"missing"
+            # placeholder so reference cycles terminate
+            self._indirect_digests[xref] = b"cycle"
+            source = self._document.xref_object(xref, compressed=True)
+            digest = hashlib.sha256(self._digest_source(source))
+            if self._document.xref_is_stream(xref):
+                digest.update(b"stream")
+                digest.update(self._document.xref_stream_raw(xref))
+            self._indirect_digests[xref] = digest.digest()
+        return self._indirect_digests[xref]
+
+
+def page_fingerprints(document, salt=b""):
+    return PageFingerprinter(salt).fingerprints(document)
@@ -0,0 +1,152 @@
+import re
+
+import numpy as np
+
+from services.margin_profile import INCH_TO_POINTS
+
+# bands a printed page number is looked for in, in priority order: inches
+# from the top or bottom edge, which edge, and how strict the match is
+MARGIN_BANDS = (
+    (0.6, "bottom", "strict"),
+    (0.6, "top", "strict"),
+    (1.1, "bottom", "normal"),
+    (1.1, "top", "normal"),
+    (1.3, "bottom", "relaxed"),
+    (1.3, "top", "relaxed"),
+)
+
+ARABIC_NUMBER = re.compile(r"^[-. ]*(\d+)[-. ]*$")
+ROMAN_NUMERAL = re.compile(
+    r"^M{0,4}(CM|CD|D?C{0,3})(XC|XL|L?X{0,3})(IX|IV|V?I{0,3})$", re.IGNORECASE
+)
+ROMAN_VALUES = {"i": 1, "v": 5, "x": 10, "l": 50, "c": 100, "d": 500, "m": 1000}
+ROMAN_NUMERALS = (
+    (1000, "m"), (900, "cm"), (500, "d"), (400, "cd"), (100, "c"), (90, "xc"),
+    (50, "l"), (40, "xl"), (10, "x"), (9, "ix"), (5, "v"), (4, "iv"), (1, "i"),
+)
+
+# wider words are running text, not a page number
+MAX_WIDTH = 100
+# roman page numbers longer than this are almost always ordinary words
+MAX_ROMAN_LENGTH = 6
+# candidates kept per page for the document-level sequence check
+MAX_CANDIDATES = 5
+# arabic numbers may run this far past the page count (blank pages skipped
+# by the numbering are rare, pages numbered beyond the count are not)
+PAGE_COUNT_SLACK = 10
+
+
+def is_roman_numeral(text):
+    return bool(text) and bool(ROMAN_NUMERAL.match(text))
+
+
+def roman_value(text):
+    total = 0
+    previous = 0
+    for letter in reversed(text.lower()):
+        value = ROMAN_VALUES[letter]
+        total += -value if value < previous else value
+        previous = max(previous, value)
+    return total
+
+
+def format_roman(number):
+    numeral = ""
+    for value, letters in ROMAN_NUMERALS:
+        repeats, number = divmod(number, value)
+        numeral += letters * repeats
+    return numeral
+
+
+def parse_page_number(text):
+    """Return (value, style) for an arabic or roman page number, or None."""
+    text = text.strip()
+    match = ARABIC_NUMBER.match(text)
+    if match:
+        return int(match.group(1)), "arabic"
+    # "L." and "D." are initials, so only dashes and brackets may wrap a
+    # roman number
+    bare = text.strip("-() ")
+    if len(bare) <= MAX_ROMAN_LENGTH and is_roman_numeral(bare):
+        return roman_value(bare), "roman"
+    return None
+
+
+class PageNumberFinder:
+    """
+    Finds the printed page number of a page from the words the margin
+    checks already extracted.
+
+    The words are split by their top coordinate once: a single vectorised
+    pass keeps only the words inside the widest band at either edge, and
+    each of those few words is then placed in the narrowest band that holds
+    it. The best candidate is the one in the highest priority band, so all
+    of MARGIN_BANDS are answered without scanning the page once per band.
+    """
+
+    def __init__(self, max_number=None, bands=MARGIN_BANDS):
+        # numbers past this are years, figures, "L" or "M" and such
+        self.max_number = max_number
+        self.bands = [
+            (inches * INCH_TO_POINTS, position, strictness, priority)
+            for priority, (inches, position, strictness) in enumerate(bands)
+        ]
+        self.widest = max(band[0] for band in self.bands)
+
+    def band_for(self, distance, position):
+        """The highest priority band at `position` holding `distance`."""
+        for band in self.bands:
+            if band[1] == position and distance <= band[0]:
+                return band
+        return None
+
+    def candidates(self, features):
+        tops = features.word_boxes[:, 1]
+        near_edges = np.flatnonzero((tops <= self.widest) | (tops >= features.height - self.widest))
+
+        candidates = []
+        for index in near_edges.tolist():
+            text = features.words[index]["text"]
+            x0, top, x1, bottom = features.word_boxes[index].tolist()
+            if x1 - x0 > MAX_WIDTH:
+                continue
+            parsed = parse_page_number(text)
+            if parsed is None:
+                continue
+            value, style = parsed
+            if value < 1 or (self.max_number is not None and value > self.max_number):
+                continue
+
+            bands = [
+                band
+                for band in (
+                    self.band_for(features.height - top, "bottom"),
+                    self.band_for(top, "top"),
+                )
+                if band is not None
+            ]
+            if not bands:
+                continue
+            margin, position, strictness, priority = min(bands, key=lambda band: band[3])
+            candidates.append(
+                {
+                    "text": text,
+                    "value": value,
+                    "style": style,
+                    "position": position,
+                    "margin": round(margin / INCH_TO_POINTS, 2),
+                    "strictness": strictness,
+                    "priority": priority,
+                    "box": [round(value, 2) for value in (x0, top, x1, bottom)],
+                }
+            )
+        candidates.sort(key=lambda candidate: candidate["priority"])
+        return candidates[:MAX_CANDIDATES]
+
+    def find(self, features):
+        """
+        Return {"label": best candidate or None, "candidates": [...]} for a
+        page's features.
+        """
+        candidates = self.candidates(features)
+        return {"label": candidates[0] if candidates else None, "candidates": candidates}
@@ -0,0 +1,182 @@
+from collections import defaultdict
+
+from services.page_numbers import format_roman
+
+# score lost for starting a new numbering run; above 1 so that a single
+# stray number (a footnote, a pronoun "I") never pays for leaving the run
+# the pages around it are following
+SWITCH_PENALTY = 1.5
+
+
+class Node:
+    """One page's candidate on the best chain found so far."""
+
+    __slots__ = ("score", "page_index", "key", "candidate", "previous")
+
+    def __init__(self, score, page_index, key, candidate, previous):
+        self.score = score
+        self.page_index = page_index
+        self.key = key
+        self.candidate = candidate
+        self.previous = previous
+
+
+def fit_page_numbers(results):
+    """
+    Fit the most likely numbering to the page number candidates of a whole
+    document (see services.page_numbers) and annotate every result with a
+    "page_sequence" entry: the expected and found label and a status of
+    "ok", "missing", "duplicate", "out_of_order" or "unnumbered".
+
+    A numbering run is a style and an offset between the printed value and
+    the page index, so roman front matter followed by arabic numbering from
+    1 are two runs. Each page either continues the current run, costing
+    nothing and scoring a point when it carries the run's next number, or
+    starts a new run for SWITCH_PENALTY. This is a Viterbi pass over the
+    runs; because the best score so far only grows, a run's score only
+    needs updating on the pages that carry one of its numbers, so the pass
+    is linear in the number of candidates.
+
+    Returns the document report: the runs, and the missing, duplicated,
+    out of order and skipped numbers.
+    """
+    run_scores = {}
+    best = Node(0.0, -1, None, None, None)
+    for page_index, result in enumerate(results):
+        updated = []
+        for candidate in result.get("page_label_candidates") or ():
+            key = (candidate["style"], candidate["value"] - page_index)
+            if any(node.key == key for node in updated):
+                continue
+            stay = run_scores.get(key)
+            switch_score = best.score - SWITCH_PENALTY
+            if stay is not None and stay.score >= switch_score:
+                node = Node(stay.score + 1, page_index, key, candidate, stay)
+            else:
+                node = Node(switch_score + 1, page_index, key, candidate, best)
+            updated.append(node)
+        # the best chain before this page is what every new run starts from,
+        # so the nodes only become visible once the page is done
+        for node in updated:
+            run_scores[node.key] = node
+            if node.score > best.score:
+                best = node
+
+    chain = []
+    node = best
+    while node is not None and node.key is not None:
+        chain.append(node)
+        node = node.previous
+    chain.reverse()
+
+    return annotate(results, chain)
+
+
+def annotate(results, chain):
+    matched = {node.page_index: node for node in chain}
+    runs = []
+    # page index -> key of the run the page belongs to
+    membership = {}
+    for node in chain:
+        if runs and runs[-1]["key"] == node.key:
+            run = runs[-1]
+            for page_index in range(run["end"] + 1, node.page_index + 1):
+                membership[page_index] = node.key
+            run["end"] = node.page_index
+        else:
+            runs.append(
+                {
+                    "key": node.key,
+                    "start": node.page_index,
+                    "end": node.page_index,
+                    "upper": node.candidate["text"].isupper(),
+                }
+            )
+            membership[node.page_index] = node.key
+    upper = {run["key"]: run["upper"] for run in runs}
+
+    seen = defaultdict(list)
+    for page_index, result in enumerate(results):
+        key = membership.get(page_index)
+        node = matched.get(page_index)
+        found = (result.get("page_label") or {}).get("text")
+        if node is not None:
+            found = node.candidate["text"]
+            seen[node.key[0], node.candidate["value"]].append(page_index + 1)
+        if key is None:
+            expected = None
+            status = "unnumbered"
+        else:
+            style, offset = key
+            expected = label_text(style, offset + page_index, upper[key])
+            if node is not None:
+                status = "ok"
+            else:
+                # a number is printed, just not the one the run expects
+                status = "out_of_order" if found else "missing"
+        result["page_sequence"] = {"expected": expected, "found": found, "status": status}
+
+    duplicated = []
+    for (style, value), pages in seen.items():
+        if len(pages) > 1:
+            duplicated.append({"label": label_text(style, value), "pages": pages})
+            for page_number in pages[1:]:
+                results[page_number - 1]["page_sequence"]["status"] = "duplicate"
+
+    out_of_order = [
+        {
+            "page_number": page_index + 1,
+            "label": result["page_sequence"]["found"],
+            "expected": result["page_sequence"]["expected"],
+        }
+        for page_index, result in enumerate(results)
+        if result["page_sequence"]["status"] == "out_of_order"
+    ]
+    skipped = []
+    last_value = {}
+    for run in runs:
+        style, offset = run["key"]
+        first = offset + run["start"]
+        previous = last_value.get(style)
+        # restarting at the last number is a duplicate, reported above
+        if previous is not None and first < previous:
+            expected = label_text(style, previous + 1, run["upper"])
+            out_of_order.append(
+                {
+                    "page_number": run["start"] + 1,
+                    "label": label_text(style, first, run["upper"]),
+                    "expected": expected,
+                }
+            )
+            results[run["start"]]["page_sequence"]["status"] = "out_of_order"
+        elif previous is not None and first > previous + 1:
+            skipped.extend(label_text(style, value) for value in range(previous + 1, first))
+        last_value[style] = offset + run["end"]
+
+    return {
+        "runs": [
+            {
+                "style": run["key"][0],
+                "start_page": run["start"] + 1,
+                "end_page": run["end"] + 1,
+                "first": label_text(run["key"][0], run["key"][1] + run["start"], run["upper"]),
+                "last": label_text(run["key"][0], run["key"][1] + run["end"], run["upper"]),
+            }
+            for run in runs
+        ],
+        "missing": [
+            {"page_number": page_index + 1, "expected": result["page_sequence"]["expected"]}
+            for page_index, result in enumerate(results)
+            if result["page_sequence"]["status"] == "missing"
+        ],
+        "duplicated": duplicated,
+        "out_of_order": out_of_order,
+        "skipped": skipped,
+    }
+
+
+def label_text(style, value, upper=False):
+    if style == "roman":
+        numeral = format_roman(value)
+        return numeral.upper() if upper else numeral
+    return str(value)
@@ -1,154 +1,429 @@
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+
 import pdfplumber
-from reportlab.pdfgen import canvas
 from io import BytesIO
-from PyPDF2 import PdfReader, PdfWriter, PdfMerger, PageObject
+from PyPDF2 import PdfReader, PdfWriter
 from django.core.files.base import ContentFile
 
-INCH_TO_POINTS = 72
+from services.columns import ColumnDetector
+from services.coverage import CoverageGrid
+from services.geometry import PageGeometry
+from services.margin_profile import DEFAULT_PROFILE
+from services.margins import check_margins
+from services.overlays import OverlayWriter, box_highlights, margin_overlay
+from services.page_features import PageFeatures, time_legacy_pass
+from services.page_numbers import PAGE_COUNT_SLACK, PageNumberFinder
+from services.page_sequence import fit_page_numbers
+from services.processes import pool_context
+from services.raster import DEFAULT_WORKERS as RASTER_WORKERS, apply_verification, verify_document
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 1
+DEFAULT_CHUNK_SIZE = 25
+
+# colour of the margin rectangle drawn for each kind of violation
+VIOLATION_COLORS = {
+    "text": (1, 0, 0),
+    "images": (1, 0, 0),
+    "blank": (0, 0, 1),
+    "ink": (1, 0, 1),
+}
+# outline colour of the words and images that cross the margins
+HIGHLIGHT_COLOR = (1, 0.5, 0)
+
+
+class PageChecker:
+    """
+    Runs the per-page checks. Kept apart from PlumberAnalyzer so that worker
+    processes can run it without the PyPDF2 reader and output writer.
+
+    The checks only read a features record (see services.page_features), so
+    another PDF library plugs in by overriding open(), page_count(),
+    document_pages() and features_class; see services.fitz_analyzer.
+    """
+
+    features_class = PageFeatures
+
+    def __init__(self, profile=DEFAULT_PROFILE, page_count=None, coverage_cell=None):
+        self.profile = profile
+        self.coverage_grid = CoverageGrid(coverage_cell)
+        self.page_number_finder = PageNumberFinder()
+        self.column_detector = ColumnDetector()
+        if page_count:
+            self.set_page_count(page_count)
+
+    def set_page_count(self, page_count):
+        # bounds the printed page numbers that are believable
+        self.page_number_finder.max_number = page_count + PAGE_COUNT_SLACK
+
+    def open(self, input_path, page_numbers=None):
+        return pdfplumber.open(input_path, pages=page_numbers)
+
+    def can_check(self, document):
+        """Whether `document`, opened elsewhere, is one open() could return."""
+        return isinstance(document, pdfplumber.PDF)
+
+    def page_count(self, document):
+        return len(document.pages)
+
+    def document_pages(self, document, page_numbers):
+        wanted = set(page_numbers)
+        for page in document.pages:
+            if page.page_number not in wanted:
+                continue
+            yield page
+            # the features hold the last reference to the page layout
+            page.close()
+
+    def check_pages(self, input_path, page_numbers):
+        """Check the given 1-based pages of the document."""
+        with self.open(input_path, page_numbers) as document:
+            return self.check_document(document, page_numbers)
+
+    def check_document(self, document, page_numbers):
+        """Check the given 1-based pages of an already open document."""
+        timings = {"extract": 0.0, "checks": 0.0}
+        checked = []
+        for page in self.document_pages(document, page_numbers):
+            checked.append(self.check_page(page, timings))
+        return checked, timings
+
+    def check_page(self, page, timings):
+        stage_started = time.perf_counter()
+        features = self.features_class(page)
+        timings["extract"] += time.perf_counter() - stage_started
+
+        stage_started = time.perf_counter()
+        # share of the page under the union of the word boxes
+        text_percentage = self.coverage_grid.coverage(features.word_boxes, features.width, features.height)
+        text_margins = self.text_margin_report(features)
+        margines_followed = text_margins["inside"]
+        image_margins = self.image_margin_report(features)
+        images_inside_margins = image_margins["inside"]
+        blank, blank_tier = self.is_page_blank(features)
+        page_numbers = self.page_number_finder.find(features)
+        columns = self.column_detector.detect(features)
+        timings["checks"] += time.perf_counter() - stage_started
+
+        violations = []
+        if not margines_followed:
+            violations.append("text")
+        if not images_inside_margins:
+            violations.append("images")
+        if blank:
+            violations.append("blank")
+        logger.debug(
+            "Page %s: text %.4f%%, text inside margins %s, images inside margins %s, blank %s",
+            features.page_number,
+            text_percentage,
+            margines_followed,
+            images_inside_margins,
+            blank,
+        )
+
+        result_object = {
+            "page_number": features.page_number,
+            "geometry": features.geometry.as_dict(),
+            "inside_borders": margines_followed and images_inside_margins,
+            "text_percentage": text_percentage,
+            "is_blank": blank,
+            "blank_tier": blank_tier,
+            "page_label": page_numbers["label"],
+            "page_label_candidates": page_numbers["candidates"],
+            "columns": columns,
+            "violations": violations,
+            "margins": {"text": text_margins, "images": image_margins},
+        }
+        return result_object
+
+    def text_margin_report(self, features):
+        limits = self.profile.limits(features.width, features.height, tolerance=2)
+        return check_margins(features.word_boxes, limits)
+
+    def image_margin_report(self, features):
+        limits = self.profile.limits(features.width, features.height)
+        return check_margins(features.image_boxes, limits)
+
+    def is_page_blank(self, features):
+        """
+        Return (blank, tier). A page is blank when it holds at most two
+        characters of text, no images and no table, or only a page number.
+        The checks run cheapest first and the first one that settles the
+        page is returned as the tier, so table finding only runs for the
+        rare near-empty pages that have vector graphics.
+        """
+        if features.text.isdigit():
+            return True, "page_number"
+        if len(features.stripped_text) > 2:
+            return False, "text"
+        if features.images:
+            return False, "images"
+        if not features.has_content:
+            return True, "empty_content"
+        if not features.has_ruling_lines:
+            return True, "no_graphics"
+        return not features.has_tables, "tables"
 
-TOP_MARGIN = 1 * INCH_TO_POINTS
-LEFT_MARGIN = 1.5 * INCH_TO_POINTS
-RIGHT_MARGIN = 1 * INCH_TO_POINTS
-BOTTOM_MARGIN = 1 * INCH_TO_POINTS
+
+def check_page_numbers(
+    input_path, page_numbers, profile, checker_class=PageChecker, page_count=None, coverage_cell=None
+):
+    # module level so ProcessPoolExecutor can pickle it
+    return checker_class(profile, page_count, coverage_cell).check_pages(input_path, page_numbers)
 
 
 class PlumberAnalyzer:
+    # PageResult.service of the results, and the engine name in services.engines
+    name = "plumber"
+    checker_class = PageChecker
+
+    def __init__(
+        self,
+        input_path,
+        workers=DEFAULT_WORKERS,
+        chunk_size=DEFAULT_CHUNK_SIZE,
+        known_results=None,
+        profile=None,
+        document=None,
+        coverage_cell=None,
+        raster_dpi=None,
+        raster_workers=None,
+        measure_baseline=False,
+    ):
+        """
+        profile is the MarginProfile pages are checked against, the default
+        1.5 inch left and 1 inch other margins when not given.
+
+        known_results maps 1-based page numbers to results reused from an
+        earlier analysis (see core.analysis); those pages are not checked
+        again but are still annotated in the output from their violations.
+
+        document is the same file already opened by the caller, such as the
+        fitz Document its page fingerprints were read from. It is checked
+        from when the checker's library can read it (see
+        PageChecker.can_check) and left open; otherwise the checker opens
+        the file itself. PyPDF2 only parses the file once a page needs
+        annotating.
+
+        coverage_cell is the side, in points, of the grid cells the text
+        coverage is measured on (see services.coverage).
+
+        raster_dpi turns on raster verification: the checked pages are also
+        rendered at that resolution by up to raster_workers processes and
+        their ink checked against the margins (see services.raster).
 
-    def __init__(self, input_path):
+        measure_baseline also times the pdfplumber calls the analyzer made
+        per page before the features were extracted once, on the checked
+        pages, and reports it with the speedup in stats(). It parses every
+        checked page a second time, so it is meant for measuring only.
+        """
         output_path = "output.pdf"
+        self.input_path = input_path
+        self.profile = profile or DEFAULT_PROFILE
+        self.workers = max(1, workers or DEFAULT_WORKERS)
+        self.chunk_size = max(1, chunk_size or DEFAULT_CHUNK_SIZE)
         self.output = PdfWriter()
-        pdf_reader = PdfReader(input_path)
+        self.overlay_writer = OverlayWriter(self.output)
+        self.coverage_cell = coverage_cell
+        self.raster_dpi = raster_dpi
+        self.raster_workers = raster_workers or RASTER_WORKERS
+        self.checker = self.checker_class(self.profile, coverage_cell=coverage_cell)
+        self.baseline_time = None
+        self._reader = None
         self.results = []
+        self.timings = {
+            "open": 0.0,
+            "extract": 0.0,
+            "checks": 0.0,
+            "raster": 0.0,
+            "sequence": 0.0,
+            "overlay": 0.0,
+        }
+        self.input_size = os.path.getsize(input_path)
+        self.output_size = None
+        started = time.perf_counter()
+
+        known_results = known_results or {}
+        checked_results = {}
+        if document is not None and self.checker.can_check(document):
+            # the caller's document, which the caller closes
+            opened = nullcontext(document)
+        else:
+            opened = self.checker.open(input_path)
+        with opened as document:
+            page_count = self.page_count = self.checker.page_count(document)
+            self.checker.set_page_count(page_count)
+            self.timings["open"] = time.perf_counter() - started
+            page_numbers = [
+                page_number
+                for page_number in range(1, page_count + 1)
+                if page_number not in known_results
+            ]
+            self.pages_checked = len(page_numbers)
+            self.pages_reused = page_count - self.pages_checked
+
+            for checked, timings in self.check_chunks(document, page_numbers):
+                self.timings["extract"] += timings["extract"]
+                self.timings["checks"] += timings["checks"]
+                for result_object in checked:
+                    checked_results[result_object["page_number"]] = result_object
+
+        if measure_baseline and checked_results:
+            self.baseline_time = time_legacy_pass(input_path, sorted(checked_results))
+            self.timings["baseline"] = self.baseline_time
+
+        if self.raster_dpi and checked_results:
+            stage_started = time.perf_counter()
+            reports = verify_document(
+                input_path, sorted(checked_results), self.profile, self.raster_dpi, self.raster_workers
+            )
+            for page_number, report in reports.items():
+                apply_verification(checked_results[page_number], report)
+            self.timings["raster"] = time.perf_counter() - stage_started
+
+        for page_number in range(1, page_count + 1):
+            result_object = checked_results.get(page_number)
+            if result_object is None:
+                result_object = dict(known_results[page_number], page_number=page_number)
+            self.results.append(result_object)
 
-        with pdfplumber.open(input_path) as pdf:
-            result_object = {}
-            for i, page in enumerate(pdf.pages):
-                text_percentage = len(page.extract_text().strip()) / (page.width * page.height) * 100
-                text_percentage = round(text_percentage, 4)
-                print(f"Page {i + 1}:")
-                print("Text Percentage:", text_percentage)
-
-                text = page.extract_text()
-                whitespace = page.extract_text().isspace()
-                newline = page.extract_text() == '\n'
-                only_page_number = page.extract_text().isdigit()
-
-                print("Is completely blank:", not page.extract_text() or whitespace or newline or only_page_number)
-                margines_followed = self.is_text_in_boundry(page)
-                print("Follows the 1-inch margin rule:", margines_followed)
-                if not margines_followed:
-                    page_obj = pdf_reader.pages[i]
-                    margin_page = self.draw_boundries(page_obj)
-                    modified_page = self.overlay_page(page_obj, margin_page)
-                    self.output.add_page(modified_page)
-
-                images_inside_margins = self.are_images_inside_boundry(page)
-                if not images_inside_margins:
-                    page_obj = pdf_reader.pages[i]
-
-                    margin_page = self.draw_boundries(page_obj, color=(1, 0, 0))
-                    modified_page = self.overlay_page(page_obj, margin_page)
-                    self.output.add_page(modified_page)
-
-                blank = self.is_page_blank(page)
-                if blank:
-                    page_obj = pdf_reader.pages[i]
-                    margin_page = self.draw_boundries(page_obj, color=(0, 0, 1))
-                    modified_page = self.overlay_page(page_obj, margin_page)
-                    self.output.add_page(modified_page)
-
-                result_object = {
-                    "page_number": i + 1,
-                    "inside_borders": margines_followed and images_inside_margins,
-                    "text_percentage": text_percentage,
-                    "is_blank": blank,
-                }
-
-                self.results.append(result_object)
+        # the numbering is fitted over the whole document, reused pages too
+        stage_started = time.perf_counter()
+        self.page_numbering = fit_page_numbers(self.results)
+        self.timings["sequence"] = time.perf_counter() - stage_started
+
+        stage_started = time.perf_counter()
+        for result_object in self.results:
+            if result_object["violations"]:
+                page_obj = self.reader.pages[result_object["page_number"] - 1]
+                self.overlay_writer.add_page(page_obj, self.annotations(page_obj, result_object))
+        self.timings["overlay"] += time.perf_counter() - stage_started
+        self.annotated_pages = len(self.output.pages)
+
+        self.timings["total"] = time.perf_counter() - started
+        logger.info(
+            "Analysed %s pages with %s in %.2fs (extract %.2fs, checks %.2fs, "
+            "overlay %.2fs, workers %s, %s pages reused, %s pages flagged)",
+            len(self.results),
+            self.name,
+            self.timings["total"],
+            self.timings["extract"],
+            self.timings["checks"],
+            self.timings["overlay"],
+            self.workers,
+            self.pages_reused,
+            self.annotated_pages,
+        )
 
         # self.output.write(output_path)
         return None
 
+    def stats(self):
+        """
+        Page and byte counters of the run; bytes_written once written. With
+        measure_baseline, also the seconds the old per-page calls took and
+        how many times faster the extract and checks stages were.
+        """
+        stats = {
+            "pages": len(self.results),
+            "pages_checked": self.pages_checked,
+            "pages_reused": self.pages_reused,
+            "pages_flagged": self.annotated_pages,
+            "bytes_read": self.input_size,
+            "bytes_written": self.output_size,
+        }
+        if self.baseline_time is not None:
+            checked_time = self.timings["extract"] + self.timings["checks"]
+            stats["baseline_seconds"] = round(self.baseline_time, 3)
+            stats["speedup"] = round(self.baseline_time / checked_time, 2) if checked_time else None
+        return stats
+
+    @property
+    def reader(self):
+        if self._reader is None:
+            self._reader = PdfReader(self.input_path)
+        return self._reader
+
+    def check_chunks(self, document, page_numbers):
+        """
+        Yield (checked pages, timings) per chunk, in page order. Checked
+        serially the pages come from `document`, the analyzer's open one.
+        With more than one worker each chunk is checked in its own process,
+        which opens the file itself; extract/checks timings are then summed
+        across workers rather than wall time.
+        """
+        if not page_numbers:
+            return
+        if self.workers == 1 or len(page_numbers) <= self.chunk_size:
+            yield self.checker.check_document(document, page_numbers)
+            return
+
+        chunks = [
+            page_numbers[start:start + self.chunk_size]
+            for start in range(0, len(page_numbers), self.chunk_size)
+        ]
+        with ProcessPoolExecutor(
+            max_workers=min(self.workers, len(chunks)),
+            mp_context=pool_context(),
+        ) as executor:
+            futures = [
+                executor.submit(
+                    check_page_numbers,
+                    self.input_path,
+                    chunk,
+                    self.profile,
+                    self.checker_class,
+                    self.page_count,
+                    self.coverage_cell,
+                )
+                for chunk in chunks
+            ]
+            # collected in submission order, so pages merge back in order
+            for future in futures:
+                yield future.result()
+
+    def write_output(self, stream):
+        """Write the annotated PDF to a binary file object."""
+        started = time.perf_counter()
+        start_position = stream.tell()
+        self.output.write(stream)
+        self.output_size = stream.tell() - start_position
+        self.timings["write"] = time.perf_counter() - started
+
     def get_pdf_bytes(self):
         pdf_bytes = BytesIO()
-        self.output.write(pdf_bytes)
+        self.write_output(pdf_bytes)
         pdf_bytes.seek(0)
         return pdf_bytes
 
-    def is_text_in_boundry(self, page):
-        media_box = page.bbox
-        left_margin = LEFT_MARGIN
-        top_margin = TOP_MARGIN
-        right_margin = RIGHT_MARGIN
-        bottom_margin = BOTTOM_MARGIN
-        page_width = media_box[2] - media_box[0]
-        page_height = media_box[3] - media_box[1]
-        text = page.extract_words()
-        for word in text:
-            x0, y0, x1, y1 = word['x0'], word['top'], word['x1'], word['bottom']
-            if (
-                x0 < left_margin - 2 or
-                x1 > (page_width - right_margin + 2) or
-                y0 < bottom_margin - 2 or
-                y1 > (page_height - top_margin + 2)
-            ):
-                print(f"Page {page.page_number} has text outside the margins.")
-                return False
-        else:
-            print(f"Page {page.page_number} respects the margins")
-            return True
-
-    def are_images_inside_boundry(self, page):
-        media_box = page.bbox
-        left_margin = LEFT_MARGIN
-        top_margin = TOP_MARGIN
-        right_margin = RIGHT_MARGIN
-        bottom_margin = BOTTOM_MARGIN
-        page_width = media_box[2] - media_box[0]
-        page_height = media_box[3] - media_box[1]
-        images = page.images
-        for image in images:
-            x0, y0, x1, y1 = image['x0'], image['top'], image['x1'], image['bottom']
-            if (
-                x0 < left_margin or
-                x1 > (page_width - right_margin) or
-                y0 < bottom_margin or
-                y1 > (page_height - top_margin)
-            ):
-                print(f"Page {page.page_number} has images outside the margins.")
-                return False
-        else:
-            print(f"Page {page.page_number} respects the margins.")
-            return True
-
-    def draw_boundries(self, page_obj, color = (1, 0, 0)):
-        left_margin = LEFT_MARGIN
-        top_margin = TOP_MARGIN
-        right_margin = RIGHT_MARGIN
-        bottom_margin = BOTTOM_MARGIN
-
-        packet = BytesIO()
-        can = canvas.Canvas(packet, pagesize=(float(page_obj.mediabox[2]), float(page_obj.mediabox[3])))
-
-        can.setStrokeColorRGB(*color)
-        page_width = float(page_obj.mediabox[2])
-        page_height = float(page_obj.mediabox[3])
-
-        can.rect(left_margin, bottom_margin, page_width - left_margin - right_margin, page_height - bottom_margin - top_margin, stroke=1, fill=0)
-        can.save()
-
-        packet.seek(0)
-        return PdfReader(packet)
-
-    def overlay_page(self, original_page, overlay_page):
-        merged_page = PageObject.create_blank_page(width=original_page.mediabox[2], height=original_page.mediabox[3])
-        merged_page.merge_page(original_page)
-        merged_page.merge_page(overlay_page.pages[0])  # Overlay the first (and only) page from overlay PDF
-        return merged_page
-
-    def is_page_blank(self, page):
-        length = len(page.extract_text().strip())
-        images = len(page.images)
-        tables = len(page.extract_tables())
-        only_page_number = page.extract_text().isdigit()
-        return (length == 0 or length == 1 or length == 2) and images == 0 and tables == 0 or  only_page_number
+    def annotations(self, page_obj, result_object):
+        """
+        Every overlay for one annotated page: the margin rectangle once per
+        violation colour, then an outline around each word and image that
+        crosses the margins.
+        """
+        overlays = []
+        geometry = PageGeometry.from_pypdf(page_obj)
+        for violation in result_object["violations"]:
+            overlay = self.draw_boundries(geometry, color=VIOLATION_COLORS[violation])
+            if overlay not in overlays:
+                overlays.append(overlay)
+
+        # results reused from older analyses may not carry the boxes
+        margins = result_object.get("margins", {})
+        boxes = [
+            box
+            for report in margins.values()
+            for box in report.get("boxes", [])
+        ]
+        if boxes:
+            overlays.append(box_highlights(boxes, geometry, HIGHLIGHT_COLOR))
+        return overlays
+
+    def draw_boundries(self, geometry, color = (1, 0, 0)):
+        return margin_overlay(self.profile, geometry, tuple(color))
@@ -0,0 +1,12 @@
+import multiprocessing
+
+# worker pools start from a clean server process rather than a fork of the
+# analysis worker, whose threads may hold database connections and locks
+START_METHOD = (
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+)
+
+
+def pool_context():
+    """The multiprocessing context every ProcessPoolExecutor is created with."""
+    return multiprocessing.get_context(START_METHOD)
@@ -0,0 +1,129 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import fitz
+import numpy as np
+
+from services.margin_profile import DEFAULT_PROFILE
+from services.margins import check_margins
+from services.processes import pool_context
+
+DEFAULT_DPI = 36
+DEFAULT_WORKERS = 2
+# pages rendered per worker task
+CHUNK_SIZE = 20
+# grey levels below this are ink; antialiased body text at low resolution
+# is mid grey rather than black
+INK_LEVEL = 200
+# pages with less of their area inked than this are blank; a page number
+# alone is a few hundredths of a percent
+BLANK_INK_PERCENTAGE = 0.1
+
+
+class RasterVerifier:
+    """
+    Checks a page by its pixels rather than its text layer: the page is
+    rendered in greyscale at a low resolution and the ink (dark pixels) is
+    measured with array operations on the pixmap. Vector drawings and
+    scanned pages, which the text checks cannot see into, are caught this
+    way.
+
+    Pages are rendered as displayed, crop box and /Rotate applied, so the
+    ink box is in the same normalised coordinates as every other check (see
+    services.geometry).
+    """
+
+    def __init__(self, profile=DEFAULT_PROFILE, dpi=DEFAULT_DPI):
+        self.profile = profile
+        self.dpi = dpi or DEFAULT_DPI
+
+    def verify(self, page):
+        pixmap = page.get_pixmap(dpi=self.dpi, colorspace=fitz.csGRAY, alpha=False)
+        pixels = np.frombuffer(pixmap.samples, dtype=np.uint8)
+        pixels = pixels.reshape(pixmap.height, pixmap.stride)[:, : pixmap.width]
+        return self.report(pixels < INK_LEVEL, page.rect.width, page.rect.height)
+
+    def report(self, ink, width, height):
+        """
+        Return {"dpi", "blank", "ink_percentage", "box", "margins"} for a
+        boolean ink mask of a `width` x `height` point page; "margins" is the
+        check_margins report of the ink box.
+        """
+        # a pixel without an inked neighbour is a speck of scanner noise
+        neighbours = np.zeros_like(ink)
+        neighbours[1:] |= ink[:-1]
+        neighbours[:-1] |= ink[1:]
+        neighbours[:, 1:] |= ink[:, :-1]
+        neighbours[:, :-1] |= ink[:, 1:]
+        ink = ink & neighbours
+
+        ink_percentage = round(float(ink.mean()) * 100, 4)
+        rows = np.flatnonzero(ink.any(axis=1))
+        columns = np.flatnonzero(ink.any(axis=0))
+        scale_x = width / ink.shape[1]
+        scale_y = height / ink.shape[0]
+        if len(rows):
+            boxes = np.array(
+                [[columns[0] * scale_x, rows[0] * scale_y, (columns[-1] + 1) * scale_x, (rows[-1] + 1) * scale_y]]
+            )
+        else:
+            boxes = np.empty((0, 4))
+        # antialiasing bleeds ink into the pixel next to an edge
+        limits = self.profile.limits(width, height, tolerance=2 + max(scale_x, scale_y))
+        return {
+            "dpi": self.dpi,
+            "blank": ink_percentage < BLANK_INK_PERCENTAGE,
+            "ink_percentage": ink_percentage,
+            "box": boxes[0].round(2).tolist() if len(boxes) else None,
+            "margins": check_margins(boxes, limits),
+        }
+
+
+def verify_pages(input_path, page_numbers, profile, dpi):
+    # module level so ProcessPoolExecutor can pickle it
+    verifier = RasterVerifier(profile, dpi)
+    with fitz.open(input_path) as document:
+        return {page_number: verifier.verify(document[page_number - 1]) for page_number in page_numbers}
+
+
+def verify_document(input_path, page_numbers, profile=DEFAULT_PROFILE, dpi=DEFAULT_DPI, workers=DEFAULT_WORKERS):
+    """
+    Raster reports for the given 1-based pages, keyed by page number.
+
+    Pages are rendered CHUNK_SIZE at a time by at most `workers` processes,
+    each opening the document once, so memory is one small pixmap per
+    worker and the time grows linearly with the page count.
+    """
+    chunks = [page_numbers[start:start + CHUNK_SIZE] for start in range(0, len(page_numbers), CHUNK_SIZE)]
+    if workers <= 1 or len(chunks) <= 1:
+        return verify_pages(input_path, page_numbers, profile, dpi)
+
+    reports = {}
+    with ProcessPoolExecutor(max_workers=min(workers, len(chunks)), mp_context=pool_context()) as executor:
+        for chunk_reports in executor.map(
+            verify_pages,
+            [input_path] * len(chunks),
+            chunks,
+            [profile] * len(chunks),
+            [dpi] * len(chunks),
+        ):
+            reports.update(chunk_reports)
+    return reports
+
+
+def apply_verification(result_object, report):
+    """
+    Fold a raster report into a page result: ink outside the margins the
+    text and image checks passed is an "ink" violation, and a page they
+    call blank is not blank when it carries ink they could not see.
+    """
+    result_object["raster"] = {key: report[key] for key in ("dpi", "blank", "ink_percentage", "box")}
+    result_object["margins"]["ink"] = report["margins"]
+    violations = result_object["violations"]
+    if not report["margins"]["inside"] and result_object["inside_borders"]:
+        result_object["inside_borders"] = False
+        violations.append("ink")
+    if result_object["is_blank"] and not report["blank"]:
+        result_object["is_blank"] = False
+        result_object["blank_tier"] = "raster"
+        if "blank" in violations:
+            violations.remove("blank")
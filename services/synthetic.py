@@ -0,0 +1,191 @@
+import random
+
+from PIL import Image
+from reportlab.lib.pagesizes import A4, landscape
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfgen import canvas
+
+from services.margin_profile import DEFAULT_PROFILE
+from services.page_numbers import format_roman
+
+WORDS = (
+    "analysis document margin review thesis chapter result method data "
+    "figure table page section research study value model sample system "
+    "design process evaluation approach measure student survey report"
+).split()
+
+FONT = "Helvetica"
+FONT_SIZE = 11
+LEADING = 14
+PAGE_NUMBER_SIZE = 10
+
+IMAGE_HEIGHT = 120
+TABLE_ROWS = 6
+TABLE_COLUMNS = 4
+TABLE_ROW_HEIGHT = 18
+
+PAGE_NUMBER_STYLES = ("arabic", "roman", "none")
+VIOLATION_SIDES = ("left", "top", "right", "bottom")
+
+# roughly what production theses look like
+THESIS_MIX = {
+    "text_density": 0.8,
+    "images_per_page": 0.3,
+    "table_rate": 0.1,
+    "violation_rate": 0.05,
+    "blank_rate": 0.02,
+    "landscape_rate": 0.05,
+    "page_numbers": "arabic",
+    "front_matter": 10,
+}
+
+
+def sentence(rng, words=12):
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def noise_image(rng, size=64):
+    """A small random RGB image, so every embedded image is distinct."""
+    image = Image.frombytes("RGB", (size, size), rng.randbytes(size * size * 3))
+    return ImageReader(image)
+
+
+def count(rng, mean):
+    """A whole count averaging `mean`, e.g. 1.3 is 1 or 2 (30% of the time)."""
+    whole = int(mean)
+    return whole + (rng.random() < mean - whole)
+
+
+def generate_document(
+    path,
+    pages=100,
+    seed=0,
+    profile=DEFAULT_PROFILE,
+    text_density=1.0,
+    images_per_page=0.2,
+    table_rate=0.0,
+    violation_rate=0.1,
+    blank_rate=0.0,
+    landscape_rate=0.0,
+    page_numbers="none",
+    front_matter=0,
+):
+    """
+    Write a `pages` page document of body text inside `profile`'s margins
+    and return a manifest with what was put on every page.
+
+    text_density is the share of the text area's lines that are filled.
+    images_per_page and table_rate set how many images and ruled tables a
+    page gets on average. violation_rate is the share of pages with a line
+    of text running into one of the margins, blank_rate the share left
+    empty and landscape_rate the share laid out on landscape A4.
+
+    page_numbers is "arabic", "roman" or "none". With arabic numbering the
+    first `front_matter` pages are numbered in roman numerals, the way
+    theses number their front matter. Numbers are printed inside the text
+    area so they are not margin violations themselves.
+
+    The same arguments always produce the same bytes.
+    """
+    if page_numbers not in PAGE_NUMBER_STYLES:
+        raise ValueError(f"Unknown page number style {page_numbers!r}")
+
+    rng = random.Random(seed)
+    pdf = canvas.Canvas(str(path), pagesize=A4, invariant=1)
+    manifest = []
+
+    for index in range(pages):
+        is_landscape = rng.random() < landscape_rate
+        page_size = landscape(A4) if is_landscape else A4
+        pdf.setPageSize(page_size)
+        page = {
+            "page_number": index + 1,
+            "landscape": is_landscape,
+            "blank": rng.random() < blank_rate,
+            "label": None,
+            "images": 0,
+            "tables": 0,
+            "violation": None,
+        }
+        if not page["blank"]:
+            draw_page(pdf, rng, page, page_size, profile, text_density, images_per_page, table_rate)
+            if rng.random() < violation_rate:
+                page["violation"] = draw_violation(pdf, rng, page_size, profile)
+            if page_numbers == "roman" or (page_numbers == "arabic" and index < front_matter):
+                page["label"] = format_roman(index + 1)
+            elif page_numbers == "arabic":
+                page["label"] = str(index + 1 - front_matter)
+            if page["label"]:
+                pdf.setFont(FONT, PAGE_NUMBER_SIZE)
+                pdf.drawCentredString(page_size[0] / 2, profile.bottom + 4, page["label"])
+        manifest.append(page)
+        pdf.showPage()
+    pdf.save()
+    return manifest
+
+
+def draw_page(pdf, rng, page, page_size, profile, text_density, images_per_page, table_rate):
+    width, height = page_size
+    left = profile.left
+    text_width = width - profile.right - left
+    words_per_line = max(1, int(text_width / (FONT_SIZE * 3.2)))
+    y = height - profile.top - FONT_SIZE
+    # the last line, with its descenders, stays above the page number line
+    bottom = profile.bottom + PAGE_NUMBER_SIZE + LEADING
+
+    for _ in range(count(rng, images_per_page)):
+        if y - IMAGE_HEIGHT < bottom:
+            break
+        pdf.drawImage(noise_image(rng), left, y - IMAGE_HEIGHT, width=text_width / 2, height=IMAGE_HEIGHT)
+        y -= IMAGE_HEIGHT + LEADING
+        page["images"] += 1
+
+    if rng.random() < table_rate and y - TABLE_ROWS * TABLE_ROW_HEIGHT > bottom:
+        y = draw_table(pdf, rng, left, y, text_width)
+        page["tables"] += 1
+
+    pdf.setFont(FONT, FONT_SIZE)
+    lines = int((y - bottom) / LEADING) + 1
+    for _ in range(round(max(lines, 0) * text_density)):
+        line = sentence(rng, words_per_line)
+        while line and pdf.stringWidth(line, FONT, FONT_SIZE) > text_width:
+            line = line.rsplit(" ", 1)[0]
+        pdf.drawString(left, y, line)
+        y -= LEADING
+
+
+def draw_table(pdf, rng, left, y, text_width):
+    """Draw a ruled table with its top at `y`, return the y below it."""
+    cell_width = text_width / TABLE_COLUMNS
+    top = y + FONT_SIZE
+    bottom = top - TABLE_ROWS * TABLE_ROW_HEIGHT
+    for row in range(TABLE_ROWS + 1):
+        pdf.line(left, top - row * TABLE_ROW_HEIGHT, left + text_width, top - row * TABLE_ROW_HEIGHT)
+    for column in range(TABLE_COLUMNS + 1):
+        pdf.line(left + column * cell_width, top, left + column * cell_width, bottom)
+    pdf.setFont(FONT, FONT_SIZE - 2)
+    for row in range(TABLE_ROWS):
+        for column in range(TABLE_COLUMNS):
+            pdf.drawString(
+                left + column * cell_width + 3,
+                top - (row + 1) * TABLE_ROW_HEIGHT + 5,
+                rng.choice(WORDS),
+            )
+    return bottom - LEADING - FONT_SIZE
+
+
+def draw_violation(pdf, rng, page_size, profile):
+    """Draw a line of text running into a random margin, return the side."""
+    width, height = page_size
+    side = rng.choice(VIOLATION_SIDES)
+    text = "This line runs into the margin"
+    pdf.setFont(FONT, FONT_SIZE)
+    if side == "left":
+        pdf.drawString(profile.left / 2, height / 2, text)
+    elif side == "right":
+        pdf.drawString(width - profile.right - 40, height / 2, text)
+    elif side == "top":
+        pdf.drawString(profile.left, height - profile.top / 2, text)
+    else:
+        pdf.drawString(profile.left, profile.bottom / 2, text)
+    return side